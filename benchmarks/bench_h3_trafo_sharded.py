@@ -0,0 +1,86 @@
+"""Throughput of the serial and the sharded h3 preprocessing chain.
+
+Run with
+
+    $ python benchmarks/bench_h3_trafo_sharded.py --num-traj 2000
+
+to print trajectories per second for the serial pandas chain and for
+sharded_h3_sequences with increasing numbers of worker processes.
+
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from lagrangian_trajectory_clustering.h3_trafo import (
+    add_max_res_h3_column,
+    fill_in_h3_gaps,
+    h3_series_to_h3_parent,
+    h3_series_to_series_of_h3_sequences,
+    remove_subsequent_identical_elements,
+)
+from lagrangian_trajectory_clustering.h3_trafo_sharded import sharded_h3_sequences
+
+
+def random_walk_trajectories(num_traj, num_obs, random_seed=0):
+    """Random-walk trajectories in the subpolar North Atlantic."""
+    rng = np.random.default_rng(random_seed)
+    steps = rng.normal(scale=0.1, size=(2, num_traj, num_obs))
+    return pd.DataFrame(
+        {
+            "latitude": (55 + np.cumsum(steps[0], axis=1)).ravel(),
+            "longitude": (-40 + np.cumsum(steps[1], axis=1)).ravel(),
+        },
+        index=pd.MultiIndex.from_product(
+            [np.arange(num_traj), np.arange(num_obs)], names=["traj", "obs"]
+        ),
+    )
+
+
+def serial_chain(df, resolution, max_res):
+    df = add_max_res_h3_column(df.copy(), max_res=max_res)
+    h3s = h3_series_to_h3_parent(df["h3maxres"], resolution=resolution)
+    return fill_in_h3_gaps(
+        remove_subsequent_identical_elements(h3_series_to_series_of_h3_sequences(h3s))
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-traj", type=int, default=2000)
+    parser.add_argument("--num-obs", type=int, default=100)
+    parser.add_argument("--resolution", type=int, default=4)
+    parser.add_argument("--max-res", type=int, default=10)
+    args = parser.parse_args()
+
+    df = random_walk_trajectories(args.num_traj, args.num_obs)
+
+    tic = time.perf_counter()
+    serial_chain(df, args.resolution, args.max_res)
+    serial_time = time.perf_counter() - tic
+    print(f"{'mode':>12s} {'workers':>8s} {'traj/s':>10s} {'speedup':>8s}")
+    print(f"{'serial':>12s} {1:8d} {args.num_traj / serial_time:10.1f} {1:8.2f}")
+
+    num_workers = 1
+    while num_workers <= os.cpu_count():
+        tic = time.perf_counter()
+        sharded_h3_sequences(
+            df,
+            resolution=args.resolution,
+            max_res=args.max_res,
+            num_workers=num_workers,
+        )
+        sharded_time = time.perf_counter() - tic
+        print(
+            f"{'sharded':>12s} {num_workers:8d} {args.num_traj / sharded_time:10.1f}"
+            f" {serial_time / sharded_time:8.2f}"
+        )
+        num_workers *= 2
+
+
+if __name__ == "__main__":
+    main()
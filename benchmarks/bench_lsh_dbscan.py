@@ -0,0 +1,125 @@
+"""Speed and agreement of approximate (MinHash/LSH) and exact edit-distance DBSCAN.
+
+Run with
+
+    $ python benchmarks/bench_lsh_dbscan.py --num-traj 2000
+
+to cluster synthetic trajectories following a few common pathways, or with
+
+    $ python benchmarks/bench_lsh_dbscan.py --cape-verde-year 1993
+
+to use the Cape Verde data (downloaded to data/ if not cached). For each
+number of LSH bands, the run time, the recall of neighbour pairs within eps
+and the adjusted Rand index (ARI) against the exact clustering are printed.
+The ARI is only informative if the exact clustering has several clusters,
+which the defaults give for the synthetic pathways.
+
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sklearn.cluster import DBSCAN
+from sklearn.metrics import adjusted_rand_score
+
+from lagrangian_trajectory_clustering.data_loading import load_cape_verde_trajectories
+from lagrangian_trajectory_clustering.distance_matrix import edist_distance_matrix
+from lagrangian_trajectory_clustering.h3_trafo_sharded import sharded_h3_sequences
+from lagrangian_trajectory_clustering.sketching import approximate_edist_distance_matrix
+
+
+def pathway_trajectories(num_traj, num_obs, num_pathways=8, random_seed=0):
+    """Trajectories scattered around a few random-walk pathways."""
+    rng = np.random.default_rng(random_seed)
+    pathways = np.cumsum(rng.normal(scale=0.3, size=(num_pathways, 2, num_obs)), -1)
+    pathway = rng.integers(num_pathways, size=num_traj)
+    noise = np.cumsum(rng.normal(scale=0.05, size=(num_traj, 2, num_obs)), axis=-1)
+    positions = pathways[pathway] + noise
+    return pd.DataFrame(
+        {
+            "latitude": (20 + positions[:, 0]).ravel(),
+            "longitude": (-30 + positions[:, 1]).ravel(),
+        },
+        index=pd.MultiIndex.from_product(
+            [np.arange(num_traj), np.arange(num_obs)], names=["traj", "obs"]
+        ),
+    )
+
+
+def timed_dbscan(distance_matrix_function, eps, min_samples):
+    tic = time.perf_counter()
+    distances = distance_matrix_function()
+    labels = DBSCAN(metric="precomputed", eps=eps, min_samples=min_samples).fit(
+        distances
+    )
+    return time.perf_counter() - tic, distances, labels.labels_
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--num-traj", type=int, default=2000)
+    parser.add_argument("--num-obs", type=int, default=60)
+    parser.add_argument("--cape-verde-year", type=int, default=None)
+    # with these defaults, the exact clustering recovers the 8 synthetic pathways
+    parser.add_argument("--resolution", type=int, default=4)
+    parser.add_argument("--eps", type=float, default=0.5)
+    parser.add_argument("--min-samples", type=int, default=5)
+    parser.add_argument("--num-perm", type=int, default=64)
+    parser.add_argument("--shingle-size", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.cape_verde_year is None:
+        df = pathway_trajectories(args.num_traj, args.num_obs)
+    else:
+        df = load_cape_verde_trajectories(args.cape_verde_year)
+        df = df.loc[: df.index.levels[0][args.num_traj - 1]]
+    h3_sequences = sharded_h3_sequences(df, resolution=args.resolution, num_workers=1)
+
+    # compile the numba kernels before timing
+    approximate_edist_distance_matrix(h3_sequences.iloc[:10], max_distance=args.eps)
+    edist_distance_matrix(h3_sequences.iloc[:10], max_distance=args.eps)
+
+    exact_time, exact, exact_labels = timed_dbscan(
+        lambda: edist_distance_matrix(h3_sequences, max_distance=args.eps),
+        args.eps,
+        args.min_samples,
+    )
+    num_clusters = len(set(exact_labels) - {-1})
+    print(f"exact clustering: {num_clusters} clusters")
+    if num_clusters < 2:
+        print("ARI is not informative, try other --eps or --resolution")
+    print(
+        f"{'mode':>8s} {'bands':>6s} {'time/s':>8s} {'speedup':>8s}"
+        f" {'recall':>7s} {'ARI':>6s}"
+    )
+    print(f"{'exact':>8s} {'':>6s} {exact_time:8.2f} {1:8.2f} {1:7.3f} {1:6.3f}")
+
+    num_bands = 1
+    while num_bands <= args.num_perm:
+        approx_time, approx, approx_labels = timed_dbscan(
+            lambda: approximate_edist_distance_matrix(
+                h3_sequences,
+                max_distance=args.eps,
+                num_perm=args.num_perm,
+                num_bands=num_bands,
+                shingle_size=args.shingle_size,
+            ),
+            args.eps,
+            args.min_samples,
+        )
+        # both matrices store the diagonal
+        n = len(h3_sequences)
+        recall = (approx.nnz - n) / (exact.nnz - n) if exact.nnz > n else np.nan
+        ari = adjusted_rand_score(exact_labels, approx_labels)
+        print(
+            f"{'lsh':>8s} {num_bands:6d} {approx_time:8.2f}"
+            f" {exact_time / approx_time:8.2f} {recall:7.3f} {ari:6.3f}"
+        )
+        num_bands *= 2
+
+
+if __name__ == "__main__":
+    main()
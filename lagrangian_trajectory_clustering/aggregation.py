@@ -0,0 +1,206 @@
+"""Per-cluster footprints and visitation densities on H3 grids.
+
+All aggregations work on integer cell ids. Cells of any resolution are
+coarsened with h3_trafo.h3_int_to_parent and grouped by sorting combined
+(cluster, cell) keys, so no per-element string operations or pandas
+groupbys are needed.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from scipy import sparse
+
+from .h3_trafo import h3_int_to_parent, h3_sequences_to_codes
+
+
+def _cell_strings_to_int(cells):
+    # equivalent to h3.string_to_h3, which is a lot slower per cell
+    cells = np.asarray(cells, dtype=object).tolist()
+    return np.array([int(cell, 16) for cell in cells], dtype=np.uint64)
+
+
+def _aggregate(cluster_of_element, traj_of_element, cells, times=None):
+    """Group elements by (cluster, cell).
+
+    Parameters
+    ----------
+    cluster_of_element: numpy.ndarray
+        Cluster id of each element.
+    traj_of_element: numpy.ndarray
+        Integer trajectory code of each element.
+    cells: numpy.ndarray
+        Integer (uint64) h3 cell of each element.
+    times: numpy.ndarray
+        Optional. Time (datetime64[ns]) of each element.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns "visits", "trajectories" and (if times are given)
+        "first_arrival". Index is "cluster_ids" and "h3".
+
+    """
+    columns = ["visits", "trajectories"] + (
+        ["first_arrival"] if times is not None else []
+    )
+    if not len(cells):
+        return pd.DataFrame(
+            columns=columns,
+            index=pd.MultiIndex.from_arrays([[], []], names=["cluster_ids", "h3"]),
+        )
+
+    clusters, cluster_codes = np.unique(cluster_of_element, return_inverse=True)
+    distinct_cells, cell_codes = np.unique(cells, return_inverse=True)
+    keys = cluster_codes.astype(np.int64) * len(distinct_cells) + cell_codes
+
+    # sorting by (key, traj) also groups the elements of each trajectory
+    order = np.lexsort((traj_of_element, keys))
+    keys = keys[order]
+    traj = traj_of_element[order]
+    new_key = np.r_[True, keys[1:] != keys[:-1]]
+    new_traj = new_key | np.r_[True, traj[1:] != traj[:-1]]
+    starts = np.flatnonzero(new_key)
+
+    df = pd.DataFrame(
+        {
+            "visits": np.diff(np.r_[starts, len(keys)]),
+            "trajectories": np.add.reduceat(new_traj.astype(np.int64), starts),
+        },
+        index=pd.MultiIndex.from_arrays(
+            [
+                clusters[keys[starts] // len(distinct_cells)],
+                [
+                    format(cell, "x")
+                    for cell in distinct_cells[keys[starts] % len(distinct_cells)]
+                ],
+            ],
+            names=["cluster_ids", "h3"],
+        ),
+    )
+    if times is not None:
+        times = np.asarray(times, dtype="datetime64[ns]")[order].view(np.int64)
+        df["first_arrival"] = np.minimum.reduceat(times, starts).view("datetime64[ns]")
+    return df[columns]
+
+
+def _select_clusters(cluster_ids, index, include_noise):
+    """Cluster id of each sequence / trajectory in index (NaN if excluded)."""
+    clusters = cluster_ids.reindex(index).to_numpy(dtype=np.float64)
+    if not include_noise:
+        clusters[clusters < 0] = np.nan
+    return clusters
+
+
+def cluster_footprints_from_sequences(
+    h3_sequences, cluster_ids, resolution=None, include_noise=False
+):
+    """Count visits of the cells of each cluster.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s. Index is "traj".
+    cluster_ids: pandas.Series
+        Cluster index of each sequence. Index is "traj".
+    resolution: int
+        Optional. Aggregate to parent cells of this resolution. Defaults to
+        the resolution of the sequences.
+    include_noise: bool
+        Also aggregate noise (cluster id -1). Defaults to False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns "visits" (number of elements of the sequences of the cluster
+        in the cell) and "trajectories" (number of distinct sequences of the
+        cluster in the cell). Index is "cluster_ids" and "h3", sorted.
+
+    """
+    codes, offsets, cells = h3_sequences_to_codes(h3_sequences)
+    cells = _cell_strings_to_int(cells)
+    if resolution is not None:
+        cells = h3_int_to_parent(cells, resolution)
+
+    traj_of_element = np.repeat(np.arange(len(h3_sequences)), np.diff(offsets))
+    clusters = _select_clusters(cluster_ids, h3_sequences.index, include_noise)
+    selected = ~np.isnan(clusters[traj_of_element])
+    traj_of_element = traj_of_element[selected]
+    return _aggregate(
+        clusters[traj_of_element].astype(np.int64),
+        traj_of_element,
+        cells[codes[selected]],
+    )
+
+
+def cluster_footprints_from_trajectories(
+    df, cluster_ids, resolution=0, include_noise=False
+):
+    """Count visits and first-arrival times of the cells of each cluster.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        Has a column "h3maxres" (see h3_trafo.add_max_res_h3_column) and
+        optionally "time", and is indexed by "traj" and "obs".
+    cluster_ids: pandas.Series
+        Cluster index of each trajectory. Index is "traj".
+    resolution: int
+        Aggregate to parent cells of this resolution. Defaults to 0.
+    include_noise: bool
+        Also aggregate noise (cluster id -1). Defaults to False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        Columns "visits" (number of observations of the cluster in the cell),
+        "trajectories" (number of distinct trajectories of the cluster in the
+        cell) and, if df has a "time" column, "first_arrival" (earliest
+        observation of the cluster in the cell). Index is "cluster_ids" and
+        "h3", sorted.
+
+    """
+    cell_codes, cells = pd.factorize(df["h3maxres"])
+    cells = h3_int_to_parent(_cell_strings_to_int(cells), resolution)
+    traj_of_element, traj = pd.factorize(df.index.get_level_values(0))
+
+    clusters = _select_clusters(cluster_ids, traj, include_noise)
+    selected = ~np.isnan(clusters[traj_of_element])
+    traj_of_element = traj_of_element[selected]
+    return _aggregate(
+        clusters[traj_of_element].astype(np.int64),
+        traj_of_element,
+        cells[cell_codes[selected]],
+        times=df["time"].to_numpy()[selected] if "time" in df.columns else None,
+    )
+
+
+def cluster_cell_matrix(footprints, column="visits"):
+    """Turn cluster footprints into a sparse cluster x cell matrix.
+
+    Parameters
+    ----------
+    footprints: pandas.DataFrame
+        As returned by cluster_footprints_from_sequences or
+        cluster_footprints_from_trajectories.
+    column: str
+        Column to use as values. Defaults to "visits".
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Matrix of shape (number of clusters, number of cells).
+    clusters: pandas.Index
+        Cluster id of each row.
+    cells: pandas.Index
+        H3 of each column. Use visualisation.polygonise_h3s(cells) to get
+        the polygons of the columns.
+
+    """
+    index = footprints.index.remove_unused_levels()
+    matrix = sparse.csr_matrix(
+        (footprints[column].to_numpy(), (index.codes[0], index.codes[1])),
+        shape=(len(index.levels[0]), len(index.levels[1])),
+    )
+    return matrix, index.levels[0], index.levels[1]
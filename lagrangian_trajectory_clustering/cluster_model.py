@@ -0,0 +1,220 @@
+"""Assign new trajectories to existing clusters."""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from numba import njit, prange
+
+from .h3_trafo import h3_sequences_to_codes
+from .metrics import levenshtein_bounded_numba
+
+
+@njit(parallel=True)
+def _nearest_representatives(
+    codes,
+    offsets,
+    rep_codes,
+    rep_offsets,
+    index_offsets,
+    index_reps,
+    eps,
+    normalize,
+):
+    num_sequences = len(offsets) - 1
+    num_reps = len(rep_offsets) - 1
+    nearest = np.full(num_sequences, -1, dtype=np.int64)
+    for q in prange(num_sequences):
+        seq = codes[offsets[q] : offsets[q + 1]]
+        len_q = len(seq)
+
+        # only representatives sharing at least one cell can be closer than
+        # the length of the longer sequence
+        shares_cell = np.zeros(num_reps, dtype=np.bool_)
+        for code in seq:
+            if code >= 0:
+                for k in range(index_offsets[code], index_offsets[code + 1]):
+                    shares_cell[index_reps[k]] = True
+
+        best = eps
+        for r in range(num_reps):
+            len_r = rep_offsets[r + 1] - rep_offsets[r]
+            max_len = max(len_q, len_r)
+            if normalize:
+                no_share_distance = 1.0 if max_len > 0 else 0.0
+                threshold = int(np.floor(min(best, 1.0) * max_len + 1e-9))
+            else:
+                no_share_distance = float(max_len)
+                threshold = int(min(best, max_len))
+            if not shares_cell[r] and no_share_distance > best:
+                continue
+            d = levenshtein_bounded_numba(
+                seq, rep_codes[rep_offsets[r] : rep_offsets[r + 1]], threshold
+            )
+            if d > threshold:
+                continue
+            if normalize:
+                distance = d / (max_len + 1e-15)
+            else:
+                distance = float(d)
+            if distance <= best and (nearest[q] < 0 or distance < best):
+                best = distance
+                nearest[q] = r
+    return nearest
+
+
+def _npz_path(file_name):
+    # np.savez appends .npz to file names without it, np.load does not
+    file_name = Path(file_name)
+    if file_name.suffix != ".npz":
+        file_name = file_name.with_name(file_name.name + ".npz")
+    return file_name
+
+
+class EditDistanceClusterModel:
+    """Fitted clustering which assigns new H3 sequences to existing clusters.
+
+    The model keeps the sequences of representative samples (the core samples of
+    DBSCAN or the medoids of k-medoids) and their cluster ids. New sequences are
+    assigned the cluster of the nearest representative within eps.
+
+    Candidates are found with an inverted index from cells to representatives
+    and distances are calculated with a threshold-pruned edit distance.
+
+    Parameters
+    ----------
+    codes: numpy.ndarray
+        Flat integer codes of all representative sequences.
+    offsets: numpy.ndarray
+        Representative i is codes[offsets[i]:offsets[i + 1]].
+    cells: numpy.ndarray
+        Distinct H3s. The code of an element is its position in cells.
+    labels: numpy.ndarray
+        Cluster id of each representative.
+    eps: float
+        Max. distance to a representative. If None, the nearest representative
+        is used irrespective of its distance.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+
+    """
+
+    def __init__(self, codes, offsets, cells, labels, eps=None, normalize=True):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.cells = np.asarray(cells)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.eps = eps
+        self.normalize = normalize
+
+        # inverted index: representatives containing cell c are
+        # index_reps[index_offsets[c]:index_offsets[c + 1]]
+        num_reps = len(self.offsets) - 1
+        rep_ids = np.repeat(np.arange(num_reps), np.diff(self.offsets))
+        keys = np.unique(self.codes * num_reps + rep_ids)
+        self.index_reps = keys % max(num_reps, 1)
+        self.index_offsets = np.searchsorted(
+            keys // max(num_reps, 1), np.arange(len(self.cells) + 1)
+        ).astype(np.int64)
+
+    @classmethod
+    def from_h3_sequences(cls, h3_sequences, labels, eps=None, normalize=True):
+        """Create a model from representative H3 sequences.
+
+        Parameters
+        ----------
+        h3_sequences: pandas.Series
+            Series of lists of h3s of the representatives.
+        labels: array-like
+            Cluster id of each representative.
+        eps: float
+            Max. distance to a representative. Defaults to None (no limit).
+        normalize: bool
+            Normalize edit distance (value 1 if complete sequence needs replacement).
+
+        Returns
+        -------
+        EditDistanceClusterModel
+
+        """
+        codes, offsets, cells = h3_sequences_to_codes(h3_sequences)
+        return cls(codes, offsets, cells, labels, eps=eps, normalize=normalize)
+
+    def predict(self, h3_sequences):
+        """Assign cluster ids to new H3 sequences.
+
+        Parameters
+        ----------
+        h3_sequences: pandas.Series
+            Series of lists of h3s.
+
+        Returns
+        -------
+        pandas.Series
+            Cluster indices (-1 if there's no representative within eps).
+            Index is from the h3_sequences.
+
+        """
+        codes, offsets, _ = h3_sequences_to_codes(h3_sequences, cells=self.cells)
+        nearest = _nearest_representatives(
+            codes,
+            offsets,
+            self.codes,
+            self.offsets,
+            self.index_offsets,
+            self.index_reps,
+            np.inf if self.eps is None else float(self.eps),
+            self.normalize,
+        )
+        cluster_ids = np.full(len(nearest), -1, dtype=np.int64)
+        cluster_ids[nearest >= 0] = self.labels[nearest[nearest >= 0]]
+        return pd.Series(cluster_ids, index=h3_sequences.index, name="cluster_ids")
+
+    def save(self, file_name):
+        """Save model to a ``.npz`` file.
+
+        Parameters
+        ----------
+        file_name: str or pathlike
+            Target file. The suffix ``.npz`` is added if missing.
+
+        """
+        # object arrays can't be loaded without pickle, so their elements are
+        # stored with their own (e.g. unicode or integer) dtype
+        np.savez(
+            _npz_path(file_name),
+            codes=self.codes,
+            offsets=self.offsets,
+            cells=np.array(self.cells.tolist()),
+            cells_are_objects=self.cells.dtype == object,
+            labels=self.labels,
+            eps=np.nan if self.eps is None else self.eps,
+            normalize=self.normalize,
+        )
+
+    @classmethod
+    def load(cls, file_name):
+        """Load model from a ``.npz`` file written by save.
+
+        Parameters
+        ----------
+        file_name: str or pathlike
+            Source file. The suffix ``.npz`` is added if missing.
+
+        Returns
+        -------
+        EditDistanceClusterModel
+
+        """
+        with np.load(_npz_path(file_name)) as npz:
+            eps = float(npz["eps"])
+            cells = npz["cells"]
+            return cls(
+                npz["codes"],
+                npz["offsets"],
+                cells.astype(object) if npz["cells_are_objects"] else cells,
+                npz["labels"],
+                eps=None if np.isnan(eps) else eps,
+                normalize=bool(npz["normalize"]),
+            )
@@ -4,7 +4,18 @@ import editdistance
 import numpy as np
 import pandas as pd
 
-from sklearn.cluster import DBSCAN, OPTICS
+from numba import njit
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import DBSCAN, HDBSCAN, OPTICS
+
+from .cluster_model import EditDistanceClusterModel
+from .distance_matrix import (
+    CondensedDistanceMatrix,
+    coordinate_distance_matrix,
+    edist_distance_matrix,
+)
+from .sketching import approximate_edist_distance_matrix
 
 
 def _edist_metric(x, y, h3_sequences, normalize=False):
@@ -18,7 +29,15 @@ def _edist_metric(x, y, h3_sequences, normalize=False):
         return (editdistance.eval(s0, s1)) / (max(len(s0), len(s1)) + 1e-15)
 
 
-def dbscan_with_edist_metric(h3_sequences, eps=0.8, normalize=True, **kwargs):
+def dbscan_with_edist_metric(
+    h3_sequences,
+    eps=0.8,
+    normalize=True,
+    return_model=False,
+    max_cell_distance=None,
+    distance_matrix=None,
+    **kwargs,
+):
     """Run DBSCAN with edit distance.
 
     Parameters
@@ -29,6 +48,16 @@ def dbscan_with_edist_metric(h3_sequences, eps=0.8, normalize=True, **kwargs):
         eps parameter of sklearn's DBSCAN. Defaults to 0.8.
     normalize: bool
         Normalize edit distance (value 1 if complete sequence needs replacement).
+    return_model: bool
+        If True, also return a model assigning new sequences to the nearest
+        core sample within eps. Defaults to False.
+    max_cell_distance: int
+        Optional. If given, substitutions are weighted with the grid distance of
+        the cells (see distance_matrix.edist_distance_matrix) and neighbourhoods
+        are precomputed as a sparse matrix. Cannot be combined with return_model.
+    distance_matrix: array-like or scipy.sparse.csr_matrix or CondensedDistanceMatrix
+        Optional. Precomputed distances to use instead of evaluating the edit
+        distance during the fit. Must match normalize and max_cell_distance.
 
     All further keyword arguments are passed to sklearns DBSCAN at instantiation.
 
@@ -36,22 +65,207 @@ def dbscan_with_edist_metric(h3_sequences, eps=0.8, normalize=True, **kwargs):
     -------
     pandas.Series
         Cluster indices. Index is from the h3_sequences.
+    EditDistanceClusterModel
+        Only if return_model is True.
 
     """
-    dbs = DBSCAN(
-        metric=partial(_edist_metric, h3_sequences=h3_sequences, normalize=normalize),
-        eps=eps,
-        **kwargs,
-    )
+    if max_cell_distance is not None:
+        if return_model:
+            raise ValueError("return_model is not supported with max_cell_distance")
+        if distance_matrix is None:
+            distance_matrix = edist_distance_matrix(
+                h3_sequences,
+                normalize=normalize,
+                max_distance=eps,
+                max_cell_distance=max_cell_distance,
+            )
+    if distance_matrix is not None:
+        if isinstance(distance_matrix, CondensedDistanceMatrix):
+            distance_matrix = distance_matrix.to_sparse(eps)
+        dbs = DBSCAN(metric="precomputed", eps=eps, **kwargs)
+        X = distance_matrix
+    else:
+        dbs = DBSCAN(
+            metric=partial(
+                _edist_metric, h3_sequences=h3_sequences, normalize=normalize
+            ),
+            eps=eps,
+            **kwargs,
+        )
+        X = np.arange(len(h3_sequences)).reshape(-1, 1).astype(int)
     cluster_indices = pd.Series(
-        dbs.fit_predict(np.arange(len(h3_sequences)).reshape(-1, 1).astype(int)),
+        dbs.fit_predict(X),
         index=h3_sequences.index,
         name="cluster_ids",
     )
+    if return_model:
+        core_samples = dbs.core_sample_indices_
+        model = EditDistanceClusterModel.from_h3_sequences(
+            h3_sequences.iloc[core_samples],
+            labels=dbs.labels_[core_samples],
+            eps=eps,
+            normalize=normalize,
+        )
+        return cluster_indices, model
     return cluster_indices
 
 
-def optics_with_edist_metric(h3_sequences, normalize=True, **kwargs):
+def approximate_dbscan_with_edist_metric(
+    h3_sequences,
+    eps=0.8,
+    normalize=True,
+    num_perm=64,
+    num_bands=32,
+    shingle_size=1,
+    random_seed=0,
+    max_bucket_size=None,
+    max_cell_distance=None,
+    **kwargs,
+):
+    """Run DBSCAN with edit distance on LSH candidate neighbours only.
+
+    Candidate neighbours are found with MinHash sketches of the cells of the
+    sequences and LSH banding (see sketching.approximate_edist_distance_matrix)
+    and verified with the exact edit distance. Neighbours not found as
+    candidates are missed, which can split or shrink clusters compared to
+    dbscan_with_edist_metric.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s.
+    eps: float
+        eps parameter of sklearn's DBSCAN. Defaults to 0.8.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    num_perm: int
+        Length of the MinHash signatures. Defaults to 64.
+    num_bands: int
+        Number of LSH bands. Must divide num_perm. More bands (with fewer rows
+        each) give a higher recall of neighbours but more candidates to verify.
+        Defaults to 32.
+    shingle_size: int
+        Number of consecutive cells per shingle. Defaults to 1.
+    random_seed: int
+        Seed of the hash functions. Defaults to 0.
+    max_bucket_size: int
+        Optional. Only pair the first max_bucket_size sequences of each LSH
+        bucket to limit the number of candidates of very common bands.
+    max_cell_distance: int
+        Optional. Weight substitutions with the grid distance of the cells
+        (see distance_matrix.edist_distance_matrix).
+
+    All further keyword arguments are passed to sklearns DBSCAN at instantiation.
+
+    Returns
+    -------
+    pandas.Series
+        Cluster indices. Index is from the h3_sequences.
+
+    """
+    distance_matrix = approximate_edist_distance_matrix(
+        h3_sequences,
+        max_distance=eps,
+        normalize=normalize,
+        num_perm=num_perm,
+        num_bands=num_bands,
+        shingle_size=shingle_size,
+        random_seed=random_seed,
+        max_bucket_size=max_bucket_size,
+        max_cell_distance=max_cell_distance,
+    )
+    return dbscan_with_edist_metric(
+        h3_sequences,
+        eps=eps,
+        normalize=normalize,
+        distance_matrix=distance_matrix,
+        **kwargs,
+    )
+
+
+def windowed_dbscan_with_edist_metric(
+    windowed_sequences,
+    window,
+    step,
+    eps=0.8,
+    normalize=True,
+    start=None,
+    end=None,
+    min_length=1,
+    **kwargs,
+):
+    """Run DBSCAN with edit distance on sub-trajectories in sliding time windows.
+
+    Parameters
+    ----------
+    windowed_sequences: windowing.SlidingWindowSequences
+        H3 sequences of all trajectories with the times the cells are entered.
+    window: timedelta-like
+        Length of each window, e.g. "30D".
+    step: timedelta-like
+        Offset between the starts of subsequent windows.
+    eps: float
+        eps parameter of sklearn's DBSCAN. Defaults to 0.8.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    start, end: datetime-like
+        Optional. Range of the window starts. Default to the time range of the
+        trajectories.
+    min_length: int
+        Only trajectories with at least min_length cells in a window are
+        clustered. Defaults to 1.
+
+    All further keyword arguments are passed to sklearns DBSCAN at instantiation.
+
+    Returns
+    -------
+    pandas.Series
+        Cluster indices. Index is "window_start" and "traj".
+
+    """
+    cluster_indices = []
+    for (
+        window_start,
+        traj,
+        distances,
+        _,
+    ) in windowed_sequences.iter_window_distance_matrices(
+        window,
+        step,
+        max_distance=eps,
+        normalize=normalize,
+        start=start,
+        end=end,
+        min_length=min_length,
+    ):
+        if not len(traj):
+            continue
+        dbs = DBSCAN(metric="precomputed", eps=eps, **kwargs)
+        cluster_indices.append(
+            pd.Series(
+                dbs.fit_predict(distances),
+                index=pd.MultiIndex.from_product(
+                    [[window_start], traj], names=["window_start", traj.name]
+                ),
+                name="cluster_ids",
+            )
+        )
+    if not cluster_indices:
+        return pd.Series(
+            [],
+            index=pd.MultiIndex.from_arrays(
+                [pd.DatetimeIndex([]), windowed_sequences.traj[:0]],
+                names=["window_start", windowed_sequences.traj.name],
+            ),
+            name="cluster_ids",
+            dtype=np.int64,
+        )
+    return pd.concat(cluster_indices)
+
+
+def optics_with_edist_metric(
+    h3_sequences, normalize=True, distance_matrix=None, **kwargs
+):
     """Run OPTICS with edit distance.
 
     Parameters
@@ -60,6 +274,10 @@ def optics_with_edist_metric(h3_sequences, normalize=True, **kwargs):
         Series of lists of h3s.
     normalize: bool
         Normalize edit distance (value 1 if complete sequence needs replacement).
+    distance_matrix: array-like or scipy.sparse.csr_matrix or CondensedDistanceMatrix
+        Optional. Precomputed distances to use instead of evaluating the edit
+        distance during the fit. A CondensedDistanceMatrix is read as a sparse
+        matrix of all distances up to max_eps.
 
     All further keyword arguments are passed to sklearns OPTICS at instantiation.
 
@@ -69,12 +287,321 @@ def optics_with_edist_metric(h3_sequences, normalize=True, **kwargs):
         Cluster indices. Index is from the h3_sequences.
 
     """
-    cls = OPTICS(
-        metric=partial(_edist_metric, h3_sequences=h3_sequences, normalize=normalize),
-        **kwargs,
+    if distance_matrix is not None:
+        if isinstance(distance_matrix, CondensedDistanceMatrix):
+            distance_matrix = distance_matrix.to_sparse(kwargs.get("max_eps", np.inf))
+        cls = OPTICS(metric="precomputed", **kwargs)
+        X = distance_matrix
+    else:
+        cls = OPTICS(
+            metric=partial(
+                _edist_metric, h3_sequences=h3_sequences, normalize=normalize
+            ),
+            **kwargs,
+        )
+        X = np.arange(len(h3_sequences)).reshape(-1, 1).astype(int)
+    cluster_indices = pd.Series(
+        cls.fit_predict(X),
+        index=h3_sequences.index,
+        name="cluster_ids",
     )
+    return cluster_indices
+
+
+def dbscan_with_coordinate_metric(
+    coordinate_sequences, eps=50.0, metric="dtw", window=-1, match_eps=None, **kwargs
+):
+    """Run DBSCAN with a coordinate-space trajectory metric.
+
+    Neighbourhoods are calculated up front as a sparse distance matrix. Pairs
+    which cannot be within eps are pruned with cheap lower bounds.
+
+    Parameters
+    ----------
+    coordinate_sequences: pandas.Series
+        Each element is an array of shape (n, 2) with latitude and longitude.
+    eps: float
+        eps parameter of sklearn's DBSCAN in units of the metric (kilometers for
+        dtw and frechet). Defaults to 50.0.
+    metric: str
+        One of "dtw", "frechet", "edr" and "lcss". Defaults to "dtw".
+    window: int
+        Sakoe-Chiba window for dtw and lcss. Defaults to -1 (no window).
+    match_eps: float
+        Matching threshold in kilometers for edr and lcss.
+
+    All further keyword arguments are passed to sklearns DBSCAN at instantiation.
+
+    Returns
+    -------
+    pandas.Series
+        Cluster indices. Index is from the coordinate_sequences.
+
+    """
+    distances = coordinate_distance_matrix(
+        coordinate_sequences,
+        metric=metric,
+        max_distance=eps,
+        window=window,
+        eps=match_eps,
+    )
+    dbs = DBSCAN(metric="precomputed", eps=eps, **kwargs)
+    cluster_indices = pd.Series(
+        dbs.fit_predict(distances),
+        index=coordinate_sequences.index,
+        name="cluster_ids",
+    )
+    return cluster_indices
+
+
+@njit
+def _assign_to_medoids(distances, medoids):
+    num_samples = distances.shape[0]
+    nearest = np.empty(num_samples, dtype=np.int64)
+    second = np.empty(num_samples, dtype=np.int64)
+    d_nearest = np.empty(num_samples, dtype=np.float64)
+    d_second = np.empty(num_samples, dtype=np.float64)
+    for o in range(num_samples):
+        nearest[o], second[o] = -1, -1
+        d_nearest[o], d_second[o] = np.inf, np.inf
+        for c in range(len(medoids)):
+            d = distances[o, medoids[c]]
+            if d < d_nearest[o]:
+                second[o], d_second[o] = nearest[o], d_nearest[o]
+                nearest[o], d_nearest[o] = c, d
+            elif d < d_second[o]:
+                second[o], d_second[o] = c, d
+    return nearest, second, d_nearest, d_second
+
+
+@njit
+def _fasterpam(distances, medoids, max_iter):
+    """Eager-swapping PAM of Schubert and Rousseeuw (2021), doi:10.1016/j.is.2021.101804."""
+    num_samples = distances.shape[0]
+    num_medoids = len(medoids)
+    if num_medoids == 1:
+        # without a second medoid, the swap gains below are undefined
+        medoids[0] = np.argmin(distances.sum(axis=0))
+        return medoids, np.zeros(num_samples, dtype=np.int64)
+    is_medoid = np.zeros(num_samples, dtype=np.bool_)
+    is_medoid[medoids] = True
+    nearest, second, d_nearest, d_second = _assign_to_medoids(distances, medoids)
+    removal_loss = np.zeros(num_medoids)
+    for o in range(num_samples):
+        removal_loss[nearest[o]] += d_second[o] - d_nearest[o]
+
+    last_swap = 0
+    for step in range(max_iter * num_samples):
+        candidate = step % num_samples
+        if step > 0 and candidate == last_swap:
+            # a complete pass without any improvement
+            break
+        if is_medoid[candidate]:
+            continue
+        delta = removal_loss.copy()
+        gain = 0.0
+        for o in range(num_samples):
+            d = distances[o, candidate]
+            if d < d_nearest[o]:
+                gain += d - d_nearest[o]
+                delta[nearest[o]] += d_nearest[o] - d_second[o]
+            elif d < d_second[o]:
+                delta[nearest[o]] += d - d_second[o]
+        removed = np.argmin(delta)
+        if delta[removed] + gain < -1e-12:
+            is_medoid[medoids[removed]] = False
+            is_medoid[candidate] = True
+            medoids[removed] = candidate
+            last_swap = candidate
+            nearest, second, d_nearest, d_second = _assign_to_medoids(
+                distances, medoids
+            )
+            removal_loss[:] = 0.0
+            for o in range(num_samples):
+                removal_loss[nearest[o]] += d_second[o] - d_nearest[o]
+
+    return medoids, nearest
+
+
+def kmedoids_with_edist_metric(
+    h3_sequences,
+    n_clusters=8,
+    normalize=True,
+    distance_matrix=None,
+    max_iter=100,
+    random_seed=None,
+    return_model=False,
+    max_cell_distance=None,
+):
+    """Run FasterPAM k-medoids with edit distance.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s.
+    n_clusters: int
+        Number of clusters (and medoids). Defaults to 8.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    distance_matrix: array-like or CondensedDistanceMatrix
+        Optional. Precomputed dense (possibly memory-mapped) distance matrix,
+        e.g. from edist_distance_matrix. Will be calculated if not given.
+        Sparse or thresholded matrices (with missing distances) are not
+        supported.
+    max_iter: int
+        Max. number of passes over all samples. Defaults to 100.
+    random_seed: int
+        Optional seed for the RNG used to select the initial medoids.
+    return_model: bool
+        If True, also return a model assigning new sequences to the nearest
+        medoid. Defaults to False. Cannot be combined with max_cell_distance.
+    max_cell_distance: int
+        Optional. Weight substitutions with the grid distance of the cells
+        (see distance_matrix.edist_distance_matrix).
+
+    Returns
+    -------
+    cluster_ids: pandas.Series
+        Cluster indices. Index is from the h3_sequences.
+    medoids: pandas.Series
+        H3 sequences of the medoids. The i-th element represents cluster i.
+    model: EditDistanceClusterModel
+        Only if return_model is True.
+
+    """
+    if return_model and max_cell_distance is not None:
+        raise ValueError("return_model is not supported with max_cell_distance")
+    if sparse.issparse(distance_matrix):
+        raise TypeError(
+            "k-medoids needs all pairwise distances, got a sparse distance matrix"
+        )
+    if distance_matrix is None:
+        distance_matrix = edist_distance_matrix(
+            h3_sequences, normalize=normalize, max_cell_distance=max_cell_distance
+        )
+    distance_matrix = np.asarray(distance_matrix, dtype=np.float64)
+    if not np.isfinite(distance_matrix).all():
+        raise TypeError(
+            "k-medoids needs all pairwise distances, got missing (infinite) distances"
+        )
+    rng = np.random.default_rng(random_seed)
+    initial_medoids = rng.choice(len(h3_sequences), n_clusters, replace=False)
+    medoids, nearest = _fasterpam(
+        distance_matrix, initial_medoids.astype(np.int64), max_iter
+    )
+    cluster_indices = pd.Series(nearest, index=h3_sequences.index, name="cluster_ids")
+    if return_model:
+        model = EditDistanceClusterModel.from_h3_sequences(
+            h3_sequences.iloc[medoids],
+            labels=np.arange(n_clusters),
+            normalize=normalize,
+        )
+        return cluster_indices, h3_sequences.iloc[medoids], model
+    return cluster_indices, h3_sequences.iloc[medoids]
+
+
+def _complete_sparse_graph(distance_matrix, min_samples):
+    """Add links at sentinel distances to a sparse distance matrix.
+
+    sklearn's HDBSCAN needs a connected graph and at least min_samples stored
+    distances per sample (including the sample itself). All connected
+    components are linked to the largest one at a distance larger than any
+    stored distance. Samples with fewer stored neighbours are linked to further
+    samples at twice that distance, so that their core distance is larger than
+    all others and they join only after all components have been merged.
+
+    """
+    num_samples = distance_matrix.shape[0]
+    coo = distance_matrix.tocoo()
+    sentinel = 2 * max(distance_matrix.max(), 1.0)
+    counts = np.bincount(coo.row, minlength=num_samples)
+
+    # link the best connected sample of each component to the one of the
+    # largest component
+    num_components, labels = connected_components(distance_matrix, directed=False)
+    order = np.lexsort((-counts, labels))
+    hubs = order[np.searchsorted(labels[order], np.arange(num_components))]
+    largest = np.argmax(np.bincount(labels))
+    others = np.delete(hubs, largest)
+    links = [
+        (others, np.full_like(others, hubs[largest]), np.full(len(others), sentinel))
+    ]
+
+    deficient = np.flatnonzero(counts < min_samples)
+    if len(deficient):
+        # at most min_samples - 1 of the next 2 * min_samples samples are
+        # linked already
+        steps = np.arange(1, min(2 * min_samples, num_samples))
+        pair_i = np.repeat(deficient[:, np.newaxis], len(steps), axis=1)
+        pair_j = (pair_i + steps) % num_samples
+        existing = np.sort(coo.row.astype(np.int64) * num_samples + coo.col)
+        keys = pair_i * num_samples + pair_j
+        k = np.minimum(np.searchsorted(existing, keys), len(existing) - 1)
+        new = existing[k] != keys
+        new &= np.cumsum(new, axis=1) <= (min_samples - counts[deficient])[:, None]
+        # links found from both ends are stored once
+        pairs = np.unique(np.sort(np.stack([pair_i[new], pair_j[new]]), axis=0), axis=1)
+        links.append((pairs[0], pairs[1], np.full(pairs.shape[1], 2 * sentinel)))
+
+    link_i, link_j, link_distances = map(np.concatenate, zip(*links))
+    if not len(link_i):
+        return distance_matrix
+    # assemble from coordinates, as adding matrices would drop explicit zeros
+    return sparse.csr_matrix(
+        (
+            np.r_[coo.data, link_distances, link_distances],
+            (np.r_[coo.row, link_i, link_j], np.r_[coo.col, link_j, link_i]),
+        ),
+        shape=distance_matrix.shape,
+    )
+
+
+def hdbscan_with_edist_metric(
+    h3_sequences, normalize=True, distance_matrix=None, max_cell_distance=None, **kwargs
+):
+    """Run HDBSCAN with edit distance.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    distance_matrix: array-like or scipy.sparse.csr_matrix or CondensedDistanceMatrix
+        Optional. Precomputed distance matrix, e.g. from edist_distance_matrix.
+        Will be calculated (dense) if not given. A CondensedDistanceMatrix is
+        read as a dense matrix, or as a sparse one if it has missing
+        distances. In a sparse (thresholded) matrix, missing distances are
+        taken to be larger than all stored distances.
+    max_cell_distance: int
+        Optional. Weight substitutions with the grid distance of the cells
+        (see distance_matrix.edist_distance_matrix).
+
+    All further keyword arguments are passed to sklearns HDBSCAN at instantiation.
+
+    Returns
+    -------
+    pandas.Series
+        Cluster indices. Index is from the h3_sequences.
+
+    """
+    if distance_matrix is None:
+        distance_matrix = edist_distance_matrix(
+            h3_sequences, normalize=normalize, max_cell_distance=max_cell_distance
+        )
+    if isinstance(distance_matrix, CondensedDistanceMatrix):
+        if distance_matrix.has_missing():
+            distance_matrix = distance_matrix.to_sparse(np.inf)
+        else:
+            distance_matrix = np.asarray(distance_matrix)
+    if sparse.issparse(distance_matrix):
+        min_samples = kwargs.get("min_samples") or kwargs.get("min_cluster_size", 5)
+        distance_matrix = _complete_sparse_graph(distance_matrix, min_samples)
+    # HDBSCAN would otherwise overwrite the (possibly memory-mapped) distances
+    kwargs.setdefault("copy", True)
+    cls = HDBSCAN(metric="precomputed", **kwargs)
     cluster_indices = pd.Series(
-        cls.fit_predict(np.arange(len(h3_sequences)).reshape(-1, 1).astype(int)),
+        cls.fit_predict(distance_matrix),
         index=h3_sequences.index,
         name="cluster_ids",
     )
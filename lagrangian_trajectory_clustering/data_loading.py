@@ -1,4 +1,6 @@
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from time import perf_counter
 
 import numpy as np
 import pandas as pd
@@ -6,6 +8,68 @@ import xarray as xr
 
 from pooch import retrieve
 
+LABSEA_ZARR_URL = (
+    "https://data.geomar.de/downloads/20.500.12085/830c72af-b5ca-44ac-8357-3173392f402b/"
+    "submitted/tracks_randomvel_mxl_osnap_backwards_1990.zarr/"
+)
+
+_CAPE_VERDE_HASHES = {
+    "cape_verde_drift_trajectories_1-10000_1993.csv.gz": "md5:ef56bc1dcf83d2dfa85f815fe4902d82",
+    "cape_verde_drift_trajectories_1-10000_1994.csv.gz": "md5:6e4d07f018294224b4c3a26092bb8e27",
+    "cape_verde_drift_trajectories_1-10000_1995.csv.gz": "md5:2ab1f9ffc881de0c21fcade2c12010ee",
+    "cape_verde_drift_trajectories_1-10000_1996.csv.gz": "md5:800a2f5b9cd8b7e56c75ce15a7363dca",
+    "cape_verde_drift_trajectories_1-10000_1997.csv.gz": "md5:d967eeceacf4d7c3630c1d396f0affc4",
+    "cape_verde_drift_trajectories_1-10000_1998.csv.gz": "md5:d21f7509aca7c5aaba17415ba6b9b9d9",
+    "cape_verde_drift_trajectories_1-10000_1999.csv.gz": "md5:38fc6fe5ddd598cc7ae9b55d6db01711",
+    "cape_verde_drift_trajectories_1-10000_2000.csv.gz": "md5:a320405ac2d4d28349f5f4bfe43073ed",
+    "cape_verde_drift_trajectories_1-10000_2001.csv.gz": "md5:ec7f77fab7c70e87783a6359623c93b8",
+    "cape_verde_drift_trajectories_1-10000_2002.csv.gz": "md5:16b66f837b8f4e831c1ad72bc513195b",
+    "cape_verde_drift_trajectories_1-10000_2003.csv.gz": "md5:8a4ce9ea4e4ed443b4dd9d590846f7b5",
+    "cape_verde_drift_trajectories_1-10000_2004.csv.gz": "md5:66f4f7b7db774f96dfc82739537efc94",
+    "cape_verde_drift_trajectories_1-10000_2005.csv.gz": "md5:479b330f464042ec7513be0fcda1bfed",
+    "cape_verde_drift_trajectories_1-10000_2006.csv.gz": "md5:28b6054fbe7fef5a132cb5e8294088c8",
+    "cape_verde_drift_trajectories_1-10000_2007.csv.gz": "md5:20e82326107a5924413829d4e6ed70e3",
+    "cape_verde_drift_trajectories_1-10000_2008.csv.gz": "md5:6ac0c56c635908c77a974b2ce9bdcd8b",
+    "cape_verde_drift_trajectories_1-10000_2009.csv.gz": "md5:b19d1c17b04a3557bbaef737b1dc6f32",
+    "cape_verde_drift_trajectories_1-10000_2010.csv.gz": "md5:1701e3b84dc783c9b9f1451b0fa531ff",
+    "cape_verde_drift_trajectories_1-10000_2011.csv.gz": "md5:31279ba8b032b5f7607e90b4c01053ab",
+    "cape_verde_drift_trajectories_1-10000_2012.csv.gz": "md5:3cd0a5e6ac37b469e6f11c1dc402103b",
+    "cape_verde_drift_trajectories_1-10000_2013.csv.gz": "md5:2f145489bc9dcd358c34689292cf5122",
+    "cape_verde_drift_trajectories_1-10000_2014.csv.gz": "md5:23d2d43aa57c83a9597cef8bd4e4642d",
+    "cape_verde_drift_trajectories_1-10000_2015.csv.gz": "md5:9054f7b6c82a4ebfd371d9a0e6c63f06",
+    "cape_verde_drift_trajectories_1-10000_2016.csv.gz": "md5:f1346b82079dec8099c89113a7678c2b",
+    "cape_verde_drift_trajectories_1-10000_2017.csv.gz": "md5:67300c5de652b6e00373e5ebad59ecf4",
+}
+
+try:
+    import pyarrow  # noqa: F401
+
+    _CSV_ENGINE = "pyarrow"
+except ImportError:
+    _CSV_ENGINE = "c"
+
+
+def _retrieve_cape_verde_file(year, cache_path):
+    key = f"cape_verde_drift_trajectories_1-10000_{year:04d}.csv.gz"
+    return retrieve(
+        url=f"doi:10.5281/zenodo.6589933/{key}",
+        path=cache_path,
+        known_hash=_CAPE_VERDE_HASHES[key],
+    )
+
+
+def _read_trajectory_csv(file_name):
+    """Read columns traj, obs, time, lat and lon of a (compressed) csv file.
+
+    Uses the multithreaded pyarrow parser if pyarrow is installed. Times are
+    datetime64[ns] with either parser.
+    """
+    df = pd.read_csv(
+        file_name, usecols=["traj", "obs", "time", "lat", "lon"], engine=_CSV_ENGINE
+    )[["traj", "obs", "time", "lat", "lon"]]
+    df["time"] = pd.to_datetime(df["time"]).astype("datetime64[ns]")
+    return df
+
 
 def load_cape_verde_trajectories(year=1993, cache_path="data/"):
     """Load Cape Verde trajectories from https://doi.org/10.5281/zenodo.6589933
@@ -23,42 +87,8 @@ def load_cape_verde_trajectories(year=1993, cache_path="data/"):
     pandas.DataFrame
         All trajectories in dataset.
     """
-    hashes = {
-        "cape_verde_drift_trajectories_1-10000_1993.csv.gz": "md5:ef56bc1dcf83d2dfa85f815fe4902d82",
-        "cape_verde_drift_trajectories_1-10000_1994.csv.gz": "md5:6e4d07f018294224b4c3a26092bb8e27",
-        "cape_verde_drift_trajectories_1-10000_1995.csv.gz": "md5:2ab1f9ffc881de0c21fcade2c12010ee",
-        "cape_verde_drift_trajectories_1-10000_1996.csv.gz": "md5:800a2f5b9cd8b7e56c75ce15a7363dca",
-        "cape_verde_drift_trajectories_1-10000_1997.csv.gz": "md5:d967eeceacf4d7c3630c1d396f0affc4",
-        "cape_verde_drift_trajectories_1-10000_1998.csv.gz": "md5:d21f7509aca7c5aaba17415ba6b9b9d9",
-        "cape_verde_drift_trajectories_1-10000_1999.csv.gz": "md5:38fc6fe5ddd598cc7ae9b55d6db01711",
-        "cape_verde_drift_trajectories_1-10000_2000.csv.gz": "md5:a320405ac2d4d28349f5f4bfe43073ed",
-        "cape_verde_drift_trajectories_1-10000_2001.csv.gz": "md5:ec7f77fab7c70e87783a6359623c93b8",
-        "cape_verde_drift_trajectories_1-10000_2002.csv.gz": "md5:16b66f837b8f4e831c1ad72bc513195b",
-        "cape_verde_drift_trajectories_1-10000_2003.csv.gz": "md5:8a4ce9ea4e4ed443b4dd9d590846f7b5",
-        "cape_verde_drift_trajectories_1-10000_2004.csv.gz": "md5:66f4f7b7db774f96dfc82739537efc94",
-        "cape_verde_drift_trajectories_1-10000_2005.csv.gz": "md5:479b330f464042ec7513be0fcda1bfed",
-        "cape_verde_drift_trajectories_1-10000_2006.csv.gz": "md5:28b6054fbe7fef5a132cb5e8294088c8",
-        "cape_verde_drift_trajectories_1-10000_2007.csv.gz": "md5:20e82326107a5924413829d4e6ed70e3",
-        "cape_verde_drift_trajectories_1-10000_2008.csv.gz": "md5:6ac0c56c635908c77a974b2ce9bdcd8b",
-        "cape_verde_drift_trajectories_1-10000_2009.csv.gz": "md5:b19d1c17b04a3557bbaef737b1dc6f32",
-        "cape_verde_drift_trajectories_1-10000_2010.csv.gz": "md5:1701e3b84dc783c9b9f1451b0fa531ff",
-        "cape_verde_drift_trajectories_1-10000_2011.csv.gz": "md5:31279ba8b032b5f7607e90b4c01053ab",
-        "cape_verde_drift_trajectories_1-10000_2012.csv.gz": "md5:3cd0a5e6ac37b469e6f11c1dc402103b",
-        "cape_verde_drift_trajectories_1-10000_2013.csv.gz": "md5:2f145489bc9dcd358c34689292cf5122",
-        "cape_verde_drift_trajectories_1-10000_2014.csv.gz": "md5:23d2d43aa57c83a9597cef8bd4e4642d",
-        "cape_verde_drift_trajectories_1-10000_2015.csv.gz": "md5:9054f7b6c82a4ebfd371d9a0e6c63f06",
-        "cape_verde_drift_trajectories_1-10000_2016.csv.gz": "md5:f1346b82079dec8099c89113a7678c2b",
-        "cape_verde_drift_trajectories_1-10000_2017.csv.gz": "md5:67300c5de652b6e00373e5ebad59ecf4",
-    }
-    key = f"cape_verde_drift_trajectories_1-10000_{year:04d}.csv.gz"
-    file_name = retrieve(
-        url=f"doi:10.5281/zenodo.6589933/{key}",
-        path=cache_path,
-        known_hash=hashes[key],
-    )
-
-    df = pd.read_csv(file_name)[["traj", "obs", "time", "lat", "lon"]]
-    df["time"] = pd.to_datetime(df["time"])
+    file_name = _retrieve_cape_verde_file(year, cache_path)
+    df = _read_trajectory_csv(file_name)
 
     df = df.set_index(["traj", "obs"])
 
@@ -70,6 +100,73 @@ def load_cape_verde_trajectories(year=1993, cache_path="data/"):
     return df
 
 
+def load_cape_verde_trajectories_multi_year(
+    years=(1993,), cache_path="data/", max_workers=None, return_timings=False
+):
+    """Load Cape Verde trajectories of several years.
+
+    Files are retrieved, decompressed and parsed concurrently by a pool of
+    threads. Trajectory ids are renumbered so that they don't collide across
+    years: The ids of each year are shifted by the largest id of all previous
+    years plus one. The result is sorted once after concatenation.
+
+    Parameters
+    ----------
+    years: iterable of int
+        Years to load. There are data for 1993..2017 available.
+        Defaults to (1993,).
+    cache_path: str or pathlike
+        Path to the cache dir. Defaults to "data/".
+    max_workers: int
+        Number of threads. Defaults to one per year.
+    return_timings: bool
+        If True, also return per-file timings. Defaults to False.
+
+    Returns
+    -------
+    pandas.DataFrame
+        All trajectories of all years.
+    pandas.DataFrame
+        Only if return_timings is True. Seconds spent for retrieving and
+        parsing each file, number of rows and the offset added to the
+        trajectory ids. Index is "year".
+    """
+    years = list(years)
+
+    def _load_year(year):
+        tic = perf_counter()
+        file_name = _retrieve_cape_verde_file(year, cache_path)
+        toc = perf_counter()
+        df = _read_trajectory_csv(file_name)
+        return df, {"retrieve": toc - tic, "parse": perf_counter() - toc}
+
+    with ThreadPoolExecutor(max_workers=max_workers or max(len(years), 1)) as pool:
+        results = list(pool.map(_load_year, years))
+
+    traj_offset = 0
+    for (df, timing), year in zip(results, years):
+        timing.update(year=year, rows=len(df), traj_offset=traj_offset)
+        if len(df):
+            df["traj"] += traj_offset
+            traj_offset = df["traj"].max() + 1
+
+    tic = perf_counter()
+    df = pd.concat([df for df, _ in results], ignore_index=True)
+    df = df.set_index(["traj", "obs"])
+    df = df.sort_index(axis=0, level=0)
+
+    # make sure cols are called latitude and longitude
+    df = df.rename(columns={"lat": "latitude", "lon": "longitude"})
+
+    if not return_timings:
+        return df
+
+    timings = pd.DataFrame([timing for _, timing in results]).set_index("year")
+    timings = timings[["retrieve", "parse", "rows", "traj_offset"]]
+    timings.attrs["concat_and_sort"] = perf_counter() - tic
+    return df, timings
+
+
 def load_medsea_trajectories(cache_path="data/"):
     """Load Med Sea trajectories from https://doi.org/10.5281/zenodo.4650317
 
@@ -119,9 +216,7 @@ def load_labsea_trajectories(cache_path="data/"):
         Path(cache_path) / "tracks_randomvel_mxl_osnap_backwards_1990_10000trajs.csv"
     )
     if not file_name.exists():
-        ds = xr.open_zarr(
-            "https://data.geomar.de/downloads/20.500.12085/830c72af-b5ca-44ac-8357-3173392f402b/submitted/tracks_randomvel_mxl_osnap_backwards_1990.zarr/"
-        )
+        ds = xr.open_zarr(LABSEA_ZARR_URL)
         df = (
             ds[
                 [
@@ -148,6 +243,82 @@ def load_labsea_trajectories(cache_path="data/"):
     return df
 
 
+def iter_labsea_trajectory_chunks(
+    store=LABSEA_ZARR_URL, num_traj=None, chunk_size=None, as_arrays=False
+):
+    """Iterate over the lab sea data in chunks of trajectories.
+
+    Chunks are aligned with the native chunking of the "traj" dimension of the
+    Zarr store, so that each stored chunk is read exactly once. Padding
+    positions (NaN latitude or longitude) are dropped.
+
+    Parameters
+    ----------
+    store: str or pathlike
+        Zarr store. Defaults to the lab sea data at
+        http://hdl.handle.net/20.500.12085/830c72af-b5ca-44ac-8357-3173392f402b
+        but can be a local copy.
+    num_traj: int
+        Optional. Only read the first num_traj trajectories.
+    chunk_size: int
+        Optional. Number of trajectories per chunk. Defaults to the native
+        chunk size of the store. Other values are rounded to multiples of it.
+    as_arrays: bool
+        If True, yield dicts of flat numpy arrays instead of data frames.
+        Defaults to False.
+
+    Yields
+    ------
+    pandas.DataFrame
+        Trajectories in chunk with columns "time", "latitude" and "longitude"
+        and index ("traj", "obs"), sorted by "traj" and "obs".
+    dict
+        If as_arrays is True: flat arrays "traj", "obs", "time", "latitude" and
+        "longitude" in the same order.
+
+    """
+    ds = xr.open_zarr(store, chunks=None)
+    total_traj = (
+        ds.sizes["traj"] if num_traj is None else min(num_traj, ds.sizes["traj"])
+    )
+    native_chunk_size = (
+        ds["lat"].encoding.get("preferred_chunks", {}).get("traj", total_traj)
+    )
+    if chunk_size is None:
+        chunk_size = native_chunk_size
+    else:
+        chunk_size = max(1, round(chunk_size / native_chunk_size)) * native_chunk_size
+    traj_ids = ds["traj"].values if "traj" in ds.coords else np.arange(ds.sizes["traj"])
+    obs_ids = ds["obs"].values if "obs" in ds.coords else np.arange(ds.sizes["obs"])
+
+    for traj_start in range(0, total_traj, chunk_size):
+        chunk = ds[["lat", "lon", "time"]].isel(
+            traj=slice(traj_start, min(traj_start + chunk_size, total_traj))
+        )
+        lat = chunk["lat"].transpose("traj", "obs").values
+        lon = chunk["lon"].transpose("traj", "obs").values
+        time = chunk["time"].transpose("traj", "obs").values
+
+        # row-major nonzero keeps the order by traj and obs
+        traj_pos, obs_pos = np.nonzero(np.isfinite(lat) & np.isfinite(lon))
+        arrays = {
+            "traj": traj_ids[traj_start + traj_pos],
+            "obs": obs_ids[obs_pos],
+            "time": time[traj_pos, obs_pos],
+            "latitude": lat[traj_pos, obs_pos],
+            "longitude": lon[traj_pos, obs_pos],
+        }
+        if as_arrays:
+            yield arrays
+        else:
+            yield pd.DataFrame(
+                {key: arrays[key] for key in ("time", "latitude", "longitude")},
+                index=pd.MultiIndex.from_arrays(
+                    [arrays["traj"], arrays["obs"]], names=["traj", "obs"]
+                ),
+            )
+
+
 def subset_trajectories(
     df=None,
     num_traj=300,
@@ -190,3 +361,27 @@ def subset_trajectories(
     df = df.reset_index()[traj_mask].set_index(["traj", "obs"])
 
     return df
+
+
+def trajectories_to_coordinate_sequences(df):
+    """Turn trajectory data into a series of coordinate arrays.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        Has columns "latitude" and "longitude" and is indexed by "traj" and "obs".
+
+    Returns
+    -------
+    pandas.Series
+        Each element is an array of shape (n, 2) with latitude and longitude of
+        one trajectory. Index is "traj".
+
+    """
+    coords = df[["latitude", "longitude"]].to_numpy(dtype=np.float64)
+    traj = df.index.get_level_values("traj").to_numpy()
+    starts = np.flatnonzero(np.r_[True, traj[1:] != traj[:-1]])
+    sequences = np.empty(len(starts), dtype=object)
+    for k, sequence in enumerate(np.split(coords, starts[1:])):
+        sequences[k] = sequence
+    return pd.Series(sequences, index=pd.Index(traj[starts], name="traj"))
@@ -0,0 +1,672 @@
+"""Precomputed distance matrices for H3 sequences and coordinate trajectories."""
+
+import json
+
+import numpy as np
+import zarr
+
+from numba import njit, prange
+from scipy import sparse
+
+from .h3_trafo import h3_cell_distance_table, h3_sequences_to_codes
+from .metrics import (
+    _local_cell_distances,
+    _weighted_levenshtein_local,
+    levenshtein_bounded_numba,
+)
+from .metrics_coordinates import (
+    discrete_frechet,
+    dtw,
+    edr,
+    frechet_lower_bound,
+    lb_keogh,
+    lb_kim,
+    lcss,
+)
+
+
+COORDINATE_METRICS = ("dtw", "frechet", "edr", "lcss")
+
+
+@njit(parallel=True)
+def _levenshtein_pairs(codes, offsets, pair_i, pair_j, max_distances):
+    distances = np.empty(len(pair_i), dtype=np.int64)
+    for p in prange(len(pair_i)):
+        i = pair_i[p]
+        j = pair_j[p]
+        distances[p] = levenshtein_bounded_numba(
+            codes[offsets[i] : offsets[i + 1]],
+            codes[offsets[j] : offsets[j + 1]],
+            max_distances[p],
+        )
+    return distances
+
+
+@njit(parallel=True)
+def _weighted_levenshtein_pairs(
+    codes,
+    offsets,
+    pair_i,
+    pair_j,
+    max_distances,
+    neighbour_offsets,
+    neighbour_codes,
+    neighbour_distances,
+    max_cell_distance,
+):
+    # pairs come grouped by pair_i, so the cell-distance lookup table of each
+    # first sequence is built once for all of its pairs
+    distances = np.empty(len(pair_i), dtype=np.float64)
+    group_starts = np.flatnonzero(np.diff(pair_i)) + 1
+    group_bounds = np.concatenate(
+        (np.zeros(1, dtype=np.int64), group_starts, np.full(1, len(pair_i)))
+    )
+    for g in prange(len(group_bounds) - 1):
+        if group_bounds[g] == group_bounds[g + 1]:
+            continue
+        i = pair_i[group_bounds[g]]
+        slot, local = _local_cell_distances(
+            codes[offsets[i] : offsets[i + 1]],
+            neighbour_offsets,
+            neighbour_codes,
+            neighbour_distances,
+            max_cell_distance,
+        )
+        for p in range(group_bounds[g], group_bounds[g + 1]):
+            j = pair_j[p]
+            distances[p] = _weighted_levenshtein_local(
+                codes[offsets[j] : offsets[j + 1]],
+                slot,
+                local,
+                max_cell_distance,
+                max_distances[p],
+            )
+    return distances
+
+
+def _iter_upper_triangle_blocks(num_sequences, block_size):
+    """Yield pairs (i, j) with i < j in blocks of rows."""
+    for row_start in range(0, num_sequences, block_size):
+        row_end = min(row_start + block_size, num_sequences)
+        pair_i, pair_j = np.nonzero(
+            np.arange(row_start, row_end)[:, np.newaxis]
+            < np.arange(num_sequences)[np.newaxis, :]
+        )
+        yield pair_i + row_start, pair_j
+
+
+def _iter_pair_blocks(pair_i, pair_j, num_sequences, block_size):
+    """Yield given pairs (sorted by pair_i) in blocks of rows."""
+    bounds = np.searchsorted(pair_i, np.r_[0:num_sequences:block_size, num_sequences])
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        yield pair_i[start:end], pair_j[start:end]
+
+
+def _to_sparse(rows, cols, values, num_sequences):
+    """Assemble a sparse matrix which also stores the (zero) diagonal."""
+    diagonal = np.arange(num_sequences)
+    rows.append(diagonal)
+    cols.append(diagonal)
+    values.append(np.zeros(num_sequences))
+    return sparse.csr_matrix(
+        (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(num_sequences, num_sequences),
+    )
+
+
+def _iter_edist_blocks(
+    h3_sequences,
+    normalize,
+    max_distance,
+    max_cell_distance,
+    block_size,
+    candidates=None,
+):
+    """Yield pairs (i, j) with i < j and their edit distances in blocks of rows.
+
+    If max_distance is given, only pairs not further apart are yielded. If
+    candidates is given, it is called with the codes and offsets of the
+    sequences and returns the only pairs (pair_i, pair_j) to be considered,
+    sorted by pair_i.
+
+    """
+    codes, offsets, cells = h3_sequences_to_codes(h3_sequences)
+    if max_cell_distance is not None:
+        cell_distance_table = h3_cell_distance_table(cells, max_cell_distance)
+    lengths = np.diff(offsets)
+
+    if candidates is None:
+        pair_blocks = _iter_upper_triangle_blocks(len(lengths), block_size)
+    else:
+        pair_blocks = _iter_pair_blocks(
+            *candidates(codes, offsets), len(lengths), block_size
+        )
+
+    for pair_i, pair_j in pair_blocks:
+        max_lengths = np.maximum(lengths[pair_i], lengths[pair_j])
+        if max_distance is None:
+            thresholds = max_lengths
+        else:
+            if normalize:
+                thresholds = max_distance * max_lengths + 1e-9
+            else:
+                thresholds = np.full(len(pair_i), max_distance + 1e-9)
+            if max_cell_distance is None:
+                thresholds = np.floor(thresholds).astype(np.int64)
+            keep = np.abs(lengths[pair_i] - lengths[pair_j]) <= thresholds
+            pair_i, pair_j = pair_i[keep], pair_j[keep]
+            max_lengths, thresholds = max_lengths[keep], thresholds[keep]
+
+        if max_cell_distance is None:
+            block_distances = _levenshtein_pairs(
+                codes, offsets, pair_i, pair_j, thresholds
+            ).astype(np.float64)
+        else:
+            block_distances = _weighted_levenshtein_pairs(
+                codes,
+                offsets,
+                pair_i,
+                pair_j,
+                thresholds.astype(np.float64),
+                *cell_distance_table,
+                max_cell_distance,
+            )
+        if max_distance is not None:
+            keep = block_distances <= thresholds
+            pair_i, pair_j = pair_i[keep], pair_j[keep]
+            max_lengths, block_distances = max_lengths[keep], block_distances[keep]
+        if normalize:
+            block_distances /= max_lengths + 1e-15
+
+        yield pair_i, pair_j, block_distances
+
+
+def edist_distance_matrix(
+    h3_sequences,
+    normalize=True,
+    max_distance=None,
+    memmap_path=None,
+    max_cell_distance=None,
+    block_size=256,
+):
+    """Calculate all pairwise edit distances of a series of H3 sequences.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    max_distance: float
+        Optional. If given, only distances not larger than max_distance are
+        calculated and a sparse matrix is returned. Pairs which are further
+        apart are pruned with a length-difference bound and an early exit of
+        the edit-distance calculation.
+    memmap_path: str or pathlike
+        Optional. Store the dense matrix in a memory-mapped ``.npy`` file
+        instead of in memory. Ignored if max_distance is given. See also
+        CondensedDistanceMatrix for a more compact on-disk format.
+    max_cell_distance: int
+        Optional. If given, substitutions are weighted with the grid distance
+        of the cells, min(h3_distance, max_cell_distance) / max_cell_distance.
+        Cell distances are tabulated once for all cells in h3_sequences. Needs
+        to be in 1..255.
+    block_size: int
+        Number of rows processed at once. Defaults to 256.
+
+    Returns
+    -------
+    numpy.ndarray or scipy.sparse.csr_matrix
+        Square matrix of distances. The sparse matrix explicitly stores all
+        distances not larger than max_distance (including zeros and the diagonal).
+
+    """
+    num_sequences = len(h3_sequences)
+    if max_distance is None:
+        if memmap_path is not None:
+            distances = np.lib.format.open_memmap(
+                memmap_path,
+                mode="w+",
+                dtype=np.float64,
+                shape=(num_sequences, num_sequences),
+            )
+        else:
+            distances = np.empty((num_sequences, num_sequences), dtype=np.float64)
+        distances[np.diag_indices(num_sequences)] = 0.0
+    else:
+        rows, cols, values = [], [], []
+
+    for pair_i, pair_j, block_distances in _iter_edist_blocks(
+        h3_sequences, normalize, max_distance, max_cell_distance, block_size
+    ):
+        if max_distance is None:
+            distances[pair_i, pair_j] = block_distances
+            distances[pair_j, pair_i] = block_distances
+        else:
+            rows.extend([pair_i, pair_j])
+            cols.extend([pair_j, pair_i])
+            values.extend([block_distances, block_distances])
+
+    if max_distance is None:
+        if memmap_path is not None:
+            distances.flush()
+        return distances
+
+    return _to_sparse(rows, cols, values, num_sequences)
+
+
+@njit(parallel=True)
+def _coordinate_metric_pairs(
+    coords, offsets, pair_i, pair_j, metric_id, max_distance, window, eps
+):
+    distances = np.empty(len(pair_i), dtype=np.float64)
+    for p in prange(len(pair_i)):
+        x = coords[offsets[pair_i[p]] : offsets[pair_i[p] + 1]]
+        y = coords[offsets[pair_j[p]] : offsets[pair_j[p] + 1]]
+        if metric_id == 0:
+            if max(lb_kim(x, y), lb_keogh(x, y, window)) > max_distance:
+                distances[p] = np.inf
+            else:
+                distances[p] = dtw(x, y, window, max_distance)
+        elif metric_id == 1:
+            if frechet_lower_bound(x, y) > max_distance:
+                distances[p] = np.inf
+            else:
+                distances[p] = discrete_frechet(x, y, max_distance)
+        elif metric_id == 2:
+            if abs(len(x) - len(y)) > max_distance:
+                distances[p] = np.inf
+            else:
+                distances[p] = edr(x, y, eps)
+        else:
+            distances[p] = lcss(x, y, eps, window)
+    return distances
+
+
+def coordinate_distance_matrix(
+    coordinate_sequences,
+    metric="dtw",
+    max_distance=None,
+    window=-1,
+    eps=None,
+    block_size=256,
+):
+    """Calculate all pairwise coordinate-space distances of trajectories.
+
+    Parameters
+    ----------
+    coordinate_sequences: pandas.Series
+        Each element is an array of shape (n, 2) with latitude and longitude.
+    metric: str
+        One of "dtw", "frechet", "edr" and "lcss". Defaults to "dtw".
+    max_distance: float
+        Optional. If given, only distances not larger than max_distance are
+        calculated and a sparse matrix is returned. Pairs are pruned with
+        LB_Kim and LB_Keogh (dtw), end-point and bounding-box bounds (frechet)
+        or the length difference (edr) before the metric is evaluated.
+    window: int
+        Sakoe-Chiba window for dtw and lcss. Negative values (the default) mean
+        no window.
+    eps: float
+        Matching threshold in kilometers for edr and lcss.
+    block_size: int
+        Number of rows processed at once. Defaults to 256.
+
+    Returns
+    -------
+    numpy.ndarray or scipy.sparse.csr_matrix
+        Square matrix of distances. The sparse matrix explicitly stores all
+        distances not larger than max_distance (including zeros and the diagonal).
+
+    """
+    if metric not in COORDINATE_METRICS:
+        raise ValueError(f"metric needs to be one of {COORDINATE_METRICS}")
+    if metric in ("edr", "lcss") and eps is None:
+        raise ValueError(f"metric {metric} needs eps")
+    lengths = np.array([len(seq) for seq in coordinate_sequences], dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    coords = np.concatenate(
+        [np.empty((0, 2))]
+        + [np.asarray(seq, dtype=np.float64) for seq in coordinate_sequences]
+    )
+    num_sequences = len(lengths)
+
+    if max_distance is None:
+        distances = np.zeros((num_sequences, num_sequences), dtype=np.float64)
+    else:
+        rows, cols, values = [], [], []
+
+    for pair_i, pair_j in _iter_upper_triangle_blocks(num_sequences, block_size):
+        block_distances = _coordinate_metric_pairs(
+            coords,
+            offsets,
+            pair_i,
+            pair_j,
+            COORDINATE_METRICS.index(metric),
+            np.inf if max_distance is None else float(max_distance),
+            window,
+            np.nan if eps is None else float(eps),
+        )
+        if max_distance is None:
+            distances[pair_i, pair_j] = block_distances
+            distances[pair_j, pair_i] = block_distances
+        else:
+            keep = block_distances <= max_distance
+            rows.extend([pair_i[keep], pair_j[keep]])
+            cols.extend([pair_j[keep], pair_i[keep]])
+            values.extend([block_distances[keep], block_distances[keep]])
+
+    if max_distance is None:
+        return distances
+    return _to_sparse(rows, cols, values, num_sequences)
+
+
+class CondensedDistanceMatrix:
+    """Compact, possibly on-disk storage of a symmetric distance matrix.
+
+    Only the upper triangle without the diagonal is stored (in the order used by
+    scipy.spatial.distance.squareform). Values are either kept as float32 or
+    quantized to uint16 with a fixed scale. With uint16, the largest value
+    (65535) is reserved for distances above the representable range which are
+    read back as inf.
+
+    Storage is a numpy array in memory, a memory-mapped ``.npy`` file or a Zarr
+    array. Rows are read lazily, so that neighbour queries and sparse
+    neighbourhood graphs for DBSCAN / OPTICS never need the full square matrix.
+
+    Parameters
+    ----------
+    data: numpy.ndarray or numpy.memmap or zarr.Array
+        Condensed distances of length num_samples * (num_samples - 1) / 2.
+    num_samples: int
+        Number of rows (and columns) of the square matrix.
+    scale: float
+        Quantization step of uint16 data. None for float32 data.
+
+    """
+
+    _missing = np.iinfo(np.uint16).max
+
+    def __init__(self, data, num_samples, scale=None):
+        self.data = data
+        self.num_samples = num_samples
+        self.scale = scale
+
+    @property
+    def shape(self):
+        """Shape of the square matrix."""
+        return (self.num_samples, self.num_samples)
+
+    @classmethod
+    def empty(cls, num_samples, dtype="uint16", max_value=1.0, path=None):
+        """Allocate storage for a condensed distance matrix.
+
+        Parameters
+        ----------
+        num_samples: int
+            Number of rows (and columns) of the square matrix.
+        dtype: str
+            Either "uint16" or "float32". Defaults to "uint16".
+        max_value: float
+            Largest distance representable with uint16. Larger distances will be
+            read as inf. Defaults to 1.0 (normalized distances, steps of approx.
+            1.5e-5). Use 65534 to store integer edit distances exactly.
+        path: str or pathlike
+            Optional. Paths ending in ``.zarr`` will be Zarr arrays, all other
+            paths memory-mapped ``.npy`` files with a ``.json`` sidecar for
+            the metadata. Defaults to None (in memory).
+
+        Returns
+        -------
+        CondensedDistanceMatrix
+
+        """
+        if dtype not in ("uint16", "float32"):
+            raise ValueError("dtype needs to be uint16 or float32")
+        size = num_samples * (num_samples - 1) // 2
+        scale = max_value / (cls._missing - 1) if dtype == "uint16" else None
+        if path is None:
+            data = np.empty(size, dtype=dtype)
+        elif str(path).endswith(".zarr"):
+            data = zarr.open_array(
+                str(path),
+                mode="w",
+                shape=(size,),
+                chunks=(min(max(size, 1), 2**20),),
+                dtype=dtype,
+            )
+            data.attrs.update({"num_samples": num_samples, "scale": scale})
+        else:
+            data = np.lib.format.open_memmap(
+                path, mode="w+", dtype=dtype, shape=(size,)
+            )
+            with open(f"{path}.json", "w") as f:
+                json.dump({"num_samples": num_samples, "scale": scale}, f)
+        return cls(data, num_samples, scale=scale)
+
+    @classmethod
+    def open(cls, path):
+        """Open a condensed distance matrix stored with empty or from_h3_sequences.
+
+        Parameters
+        ----------
+        path: str or pathlike
+            A ``.zarr`` store or a ``.npy`` file.
+
+        Returns
+        -------
+        CondensedDistanceMatrix
+
+        """
+        if str(path).endswith(".zarr"):
+            data = zarr.open_array(str(path), mode="r")
+            meta = dict(data.attrs)
+        else:
+            data = np.load(path, mmap_mode="r")
+            with open(f"{path}.json") as f:
+                meta = json.load(f)
+        return cls(data, meta["num_samples"], scale=meta["scale"])
+
+    @classmethod
+    def from_h3_sequences(
+        cls,
+        h3_sequences,
+        normalize=True,
+        dtype="uint16",
+        path=None,
+        max_distance=None,
+        max_cell_distance=None,
+        block_size=256,
+    ):
+        """Calculate all pairwise edit distances into a condensed matrix.
+
+        Parameters
+        ----------
+        h3_sequences: pandas.Series
+            Series of lists of h3s.
+        normalize: bool
+            Normalize edit distance (value 1 if complete sequence needs replacement).
+        dtype: str
+            Either "uint16" or "float32". Defaults to "uint16".
+        path: str or pathlike
+            Optional. See empty.
+        max_distance: float
+            Optional. Distances larger than this are not calculated and stored as inf.
+        max_cell_distance: int
+            Optional. Weight substitutions with the grid distance of the cells
+            (see edist_distance_matrix).
+        block_size: int
+            Number of rows processed at once. Defaults to 256.
+
+        Returns
+        -------
+        CondensedDistanceMatrix
+
+        """
+        if normalize:
+            max_value = 1.0
+        elif max_cell_distance is not None:
+            # weighted distances are multiples of 1 / max_cell_distance
+            max_value = (cls._missing - 1) / max_cell_distance
+        else:
+            max_value = float(cls._missing - 1)
+        distances = cls.empty(
+            len(h3_sequences), dtype=dtype, max_value=max_value, path=path
+        )
+        row_start = 0
+        for pair_i, pair_j, block_distances in _iter_edist_blocks(
+            h3_sequences, normalize, max_distance, max_cell_distance, block_size
+        ):
+            row_end = min(row_start + block_size, distances.num_samples)
+            start = distances._row_offset(row_start)
+            stop = distances._row_offset(row_end)
+            block = np.full(stop - start, np.inf)
+            block[distances._condensed_index(pair_i, pair_j) - start] = block_distances
+            distances.data[start:stop] = distances._encode(block)
+            row_start = row_end
+        if isinstance(distances.data, np.memmap):
+            distances.data.flush()
+        return distances
+
+    def _row_offset(self, i):
+        """Condensed position of element (i, i + 1)."""
+        n = self.num_samples
+        return i * n - i * (i + 1) // 2
+
+    def _condensed_index(self, i, j):
+        """Condensed position of elements (i, j) with i < j."""
+        return self._row_offset(i) + (j - i - 1)
+
+    def _encode(self, values):
+        if self.scale is None:
+            return values.astype(np.float32)
+        stored = np.rint(np.asarray(values) / self.scale)
+        return np.where(stored < self._missing, stored, self._missing).astype(np.uint16)
+
+    def _decode(self, stored):
+        stored = np.asarray(stored)
+        if self.scale is None:
+            return stored.astype(np.float64)
+        return np.where(stored < self._missing, stored * self.scale, np.inf)
+
+    def _round_trip(self, value):
+        # stored distances are compared with a threshold rounded the same way,
+        # so that e.g. a distance equal to eps is not lost to rounding up
+        return self._decode(self._encode(np.array([value], dtype=np.float64)))[0]
+
+    def _take(self, positions):
+        if hasattr(self.data, "get_coordinate_selection"):
+            return self.data.get_coordinate_selection(positions)
+        return self.data[positions]
+
+    def row(self, i):
+        """Read all distances of sample i.
+
+        Parameters
+        ----------
+        i: int
+            Row number.
+
+        Returns
+        -------
+        numpy.ndarray
+            Distances of sample i to all samples (zero for itself).
+
+        """
+        n = self.num_samples
+        distances = np.zeros(n)
+        if i > 0:
+            distances[:i] = self._decode(
+                self._take(self._condensed_index(np.arange(i), i))
+            )
+        start = self._row_offset(i)
+        distances[i + 1 :] = self._decode(self.data[start : start + n - i - 1])
+        return distances
+
+    def radius_neighbors(self, i, radius):
+        """Find all samples not further than radius from sample i.
+
+        Parameters
+        ----------
+        i: int
+            Row number.
+        radius: float
+            Max. distance.
+
+        Returns
+        -------
+        numpy.ndarray
+            Indices of the neighbours (including i).
+
+        """
+        distances = self.row(i)
+        return np.flatnonzero(
+            (distances <= self._round_trip(radius)) & np.isfinite(distances)
+        )
+
+    def _iter_blocks(self, block_size):
+        """Yield pairs (i, j) with i < j and their distances in blocks of rows."""
+        row_start = 0
+        for pair_i, pair_j in _iter_upper_triangle_blocks(self.num_samples, block_size):
+            row_end = min(row_start + block_size, self.num_samples)
+            stored = self.data[self._row_offset(row_start) : self._row_offset(row_end)]
+            yield pair_i, pair_j, self._decode(stored)
+            row_start = row_end
+
+    def has_missing(self, block_size=256):
+        """Check for distances which are not stored (read back as inf).
+
+        Parameters
+        ----------
+        block_size: int
+            Number of rows read at once. Defaults to 256.
+
+        Returns
+        -------
+        bool
+            True if any distance is missing, e.g. as it is larger than the
+            max_distance of from_h3_sequences.
+
+        """
+        return any(
+            np.isinf(block_distances).any()
+            for _, _, block_distances in self._iter_blocks(block_size)
+        )
+
+    def to_sparse(self, max_distance, block_size=256):
+        """Build a sparse neighbourhood matrix.
+
+        Parameters
+        ----------
+        max_distance: float
+            Only distances not larger than this are kept.
+        block_size: int
+            Number of rows read at once. Defaults to 256.
+
+        Returns
+        -------
+        scipy.sparse.csr_matrix
+            Explicitly stores all distances not larger than max_distance
+            (including zeros and the diagonal). Can be used with
+            metric="precomputed" in sklearn's DBSCAN and OPTICS. Distances
+            stored within one quantization step above max_distance are
+            included as max_distance.
+
+        """
+        threshold = self._round_trip(max_distance)
+        rows, cols, values = [], [], []
+        for pair_i, pair_j, block_distances in self._iter_blocks(block_size):
+            keep = (block_distances <= threshold) & np.isfinite(block_distances)
+            block_distances = np.minimum(block_distances[keep], max_distance)
+            rows.extend([pair_i[keep], pair_j[keep]])
+            cols.extend([pair_j[keep], pair_i[keep]])
+            values.extend([block_distances, block_distances])
+        return _to_sparse(rows, cols, values, self.num_samples)
+
+    def __array__(self, dtype=None, copy=None):
+        distances = np.zeros(self.shape, dtype=dtype or np.float64)
+        for pair_i, pair_j, block_distances in self._iter_blocks(256):
+            distances[pair_i, pair_j] = block_distances
+            distances[pair_j, pair_i] = block_distances
+        return distances
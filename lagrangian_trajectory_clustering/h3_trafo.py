@@ -114,6 +114,32 @@ def h3_series_to_h3_parent(h3_series, resolution=0):
     return h3_series.apply(lambda cellid: h3.h3_to_parent(cellid, resolution))
 
 
+def h3_int_to_parent(cells, resolution=0):
+    """Convert integer h3 cell ids to a coarser resolution.
+
+    Vectorized version of h3.h3_to_parent working directly on the bits of the
+    64-bit cell ids.
+
+    Parameters
+    ----------
+    cells: numpy.ndarray
+        Integer (uint64) h3 cell ids of resolution not smaller than resolution.
+    resolution: int
+        H3 resolution. Default to 0 corresponding to approx. 1000 kilometers.
+
+    Returns
+    -------
+    numpy.ndarray
+        Integer (uint64) h3 cell ids.
+
+    See https://h3geo.org/docs/core-library/h3Indexing/
+    """
+    cells = np.asarray(cells, dtype=np.uint64)
+    resolution_bits = np.uint64(0xF << 52)
+    unused_digits = np.uint64((1 << (3 * (15 - resolution))) - 1)
+    return (cells & ~resolution_bits) | np.uint64(resolution << 52) | unused_digits
+
+
 def h3_series_to_series_of_h3_sequences(h3_series=None, groupby=None):
     """Turn a series of H3s into a series of lists of H3s.
 
@@ -221,3 +247,90 @@ def h3_to_geo(h3_series):
         h3_series.apply(h3.h3_to_geo).values.tolist(),
         columns=["latitude", "longitude"],
     ).set_index(h3_series.index)
+
+
+def h3_sequences_to_codes(h3_sequences, cells=None):
+    """Turn a series of H3 sequences into one flat array of integer codes.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Each element contains an ordered collection of H3s.
+    cells: array-like
+        Optional. Distinct H3s to encode against. H3s which are not in cells
+        get code -1. If not given, the vocabulary is built from h3_sequences.
+
+    Returns
+    -------
+    codes: numpy.ndarray
+        Integer code of each element of all sequences concatenated.
+    offsets: numpy.ndarray
+        Sequence i is codes[offsets[i]:offsets[i + 1]].
+    cells: numpy.ndarray
+        Distinct H3s. The code of an element is its position in cells.
+
+    """
+    lengths = np.fromiter(
+        (len(seq) for seq in h3_sequences), dtype=np.int64, count=len(h3_sequences)
+    )
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    flat = pd.Series([cell for seq in h3_sequences for cell in seq], dtype=object)
+    if cells is None:
+        codes, cells = pd.factorize(flat)
+    else:
+        codes = pd.Index(cells).get_indexer(flat)
+    return codes.astype(np.int64), offsets, np.asarray(cells)
+
+
+def h3_cell_distance_table(cells, max_cell_distance):
+    """Tabulate grid distances between nearby H3s of a vocabulary.
+
+    For each cell, all other cells of the vocabulary which are less than
+    max_cell_distance grid steps away are stored with their distance. All other
+    pairs are at least max_cell_distance apart. The table hence is bounded by
+    len(cells) times the size of a k-ring of radius max_cell_distance - 1.
+
+    Parameters
+    ----------
+    cells: array-like
+        Distinct H3s (e.g. the cells returned by h3_sequences_to_codes).
+    max_cell_distance: int
+        Grid distance (see h3.h3_distance) from which on cells are not tabulated.
+        Needs to be in 1..255, as weighted edit distances keep cell distances
+        as uint8.
+
+    Returns
+    -------
+    neighbour_offsets: numpy.ndarray
+        Neighbours of cell i are at positions neighbour_offsets[i]:neighbour_offsets[i + 1]
+        of the following arrays.
+    neighbour_codes: numpy.ndarray
+        Codes (positions in cells) of the neighbours, sorted for each cell.
+    neighbour_distances: numpy.ndarray
+        Grid distances to the neighbours.
+
+    """
+    if not 1 <= max_cell_distance <= 255:
+        raise ValueError(
+            f"max_cell_distance needs to be in 1..255, got {max_cell_distance}"
+        )
+    code_of_cell = {cell: code for code, cell in enumerate(cells)}
+    rows, cols, distances = [], [], []
+    for code, cell in enumerate(cells):
+        rings = h3.k_ring_distances(cell, max_cell_distance - 1)
+        for distance, ring in enumerate(rings[1:], start=1):
+            for neighbour in ring:
+                if neighbour in code_of_cell:
+                    rows.append(code)
+                    cols.append(code_of_cell[neighbour])
+                    distances.append(distance)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    order = np.lexsort((cols, rows))
+    neighbour_offsets = np.searchsorted(rows[order], np.arange(len(cells) + 1))
+    return (
+        neighbour_offsets.astype(np.int64),
+        cols[order],
+        np.asarray(distances, dtype=np.int64)[order],
+    )
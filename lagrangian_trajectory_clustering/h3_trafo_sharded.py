@@ -0,0 +1,252 @@
+"""Sharded, multi-process execution of the h3 preprocessing chain.
+
+The chain of h3_trafo functions (add_max_res_h3_column, h3_series_to_h3_parent,
+h3_series_to_series_of_h3_sequences, remove_subsequent_identical_elements and
+fill_in_h3_gaps) is applied per trajectory. Here, trajectories are partitioned
+into contiguous blocks which are processed by a pool of worker processes. The
+input coordinates (or max. resolution cells) are placed in shared memory, so
+workers read them without pickling.
+
+"""
+
+import os
+
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from h3.api import basic_int as h3_int
+
+from .h3_trafo import h3_int_to_parent
+
+
+def _to_shared_memory(array):
+    """Copy an array to a new shared-memory block."""
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _process_pool(num_workers):
+    # forking a process which already runs numba's thread pool can deadlock
+    return ProcessPoolExecutor(max_workers=num_workers, mp_context=get_context("spawn"))
+
+
+def _h3_chain(cells, resolution, fill_gaps):
+    """Parent cells, drop subsequent duplicates and fill gaps for one trajectory."""
+    cells = h3_int_to_parent(cells, resolution)
+    if len(cells) == 0:
+        return cells
+    cells = cells[np.r_[True, cells[1:] != cells[:-1]]]
+    if not fill_gaps or len(cells) == 1:
+        return cells
+    filled = []
+    for last, new in zip(cells[:-1], cells[1:]):
+        filled.extend(h3_int.h3_line(int(last), int(new))[:-1])
+    filled.append(int(cells[-1]))
+    return np.asarray(filled, dtype=np.uint64)
+
+
+def _process_shard(shared_arrays, traj_start, traj_end, max_res, resolution, fill_gaps):
+    """Run the h3 chain for trajectories traj_start..traj_end-1.
+
+    Returns
+    -------
+    traj_start: int
+    lengths: numpy.ndarray
+        Number of cells of each trajectory.
+    cells: numpy.ndarray
+        Concatenated integer cells of all trajectories.
+
+    """
+    handles = {}
+    arrays = {}
+    for key, (name, shape, dtype) in shared_arrays.items():
+        handles[key] = shared_memory.SharedMemory(name=name)
+        arrays[key] = np.ndarray(shape, dtype=dtype, buffer=handles[key].buf)
+
+    try:
+        offsets = arrays["offsets"]
+        lengths = np.empty(traj_end - traj_start, dtype=np.int64)
+        results = []
+        for k, traj in enumerate(range(traj_start, traj_end)):
+            start, end = offsets[traj], offsets[traj + 1]
+            if "cells" in arrays:
+                cells = arrays["cells"][start:end].copy()
+            else:
+                latitude = arrays["latitude"][start:end]
+                longitude = arrays["longitude"][start:end]
+                cells = np.fromiter(
+                    (
+                        h3_int.geo_to_h3(lat, lon, max_res)
+                        for lat, lon in zip(latitude, longitude)
+                    ),
+                    dtype=np.uint64,
+                    count=end - start,
+                )
+            cells = _h3_chain(cells, resolution, fill_gaps)
+            lengths[k] = len(cells)
+            results.append(cells)
+    finally:
+        del arrays
+        for handle in handles.values():
+            handle.close()
+
+    return traj_start, lengths, np.concatenate([np.empty(0, np.uint64)] + results)
+
+
+def sharded_h3_sequences(
+    df,
+    resolution=0,
+    max_res=15,
+    fill_gaps=True,
+    num_workers=None,
+    num_shards=None,
+    return_codes=False,
+    executor=None,
+):
+    """Turn trajectories into H3 sequences using a pool of worker processes.
+
+    This is equivalent to running add_max_res_h3_column, h3_series_to_h3_parent,
+    h3_series_to_series_of_h3_sequences, remove_subsequent_identical_elements
+    and (optionally) fill_in_h3_gaps.
+
+    Parameters
+    ----------
+    df: pandas.DataFrame
+        Has columns "latitude" and "longitude" (or an existing "h3maxres"
+        column which will be used instead) and is indexed by "traj" and "obs".
+        Rows need to be sorted by trajectory.
+    resolution: int
+        H3 resolution of the sequences. Defaults to 0.
+    max_res: int
+        Resolution of the intermediate max. resolution cells. Defaults to 15.
+    fill_gaps: bool
+        Fill gaps between subsequent cells with h3_line. Defaults to True.
+    num_workers: int
+        Number of worker processes. Defaults to the number of CPUs. With
+        num_workers=1, all shards are processed in the calling process.
+    num_shards: int
+        Number of contiguous blocks of trajectories. Defaults to four per worker.
+    return_codes: bool
+        If True, return the flat integer cells and offsets instead of a Series.
+        Defaults to False.
+    executor: concurrent.futures.ProcessPoolExecutor
+        Optional. Existing pool to use instead of starting a new one.
+
+    Returns
+    -------
+    pandas.Series
+        Each element contains an ordered collection (list) of h3s. Index is "traj".
+    If return_codes is True, instead:
+    cells: numpy.ndarray
+        Integer h3s of all sequences concatenated.
+    offsets: numpy.ndarray
+        Sequence i is cells[offsets[i]:offsets[i + 1]].
+    traj: pandas.Index
+        Trajectory ids.
+
+    """
+    traj = df.index.get_level_values(0).to_numpy()
+    starts = np.flatnonzero(np.r_[True, traj[1:] != traj[:-1]])[: len(traj)]
+    offsets = np.r_[starts, len(traj)].astype(np.int64)
+    num_traj = len(offsets) - 1
+
+    inputs = {"offsets": offsets}
+    if "h3maxres" in df.columns:
+        inputs["cells"] = np.array(
+            [h3_int.string_to_h3(cell) for cell in df["h3maxres"]], dtype=np.uint64
+        )
+    else:
+        inputs["latitude"] = df["latitude"].to_numpy(dtype=np.float64)
+        inputs["longitude"] = df["longitude"].to_numpy(dtype=np.float64)
+
+    if num_workers is None:
+        num_workers = os.cpu_count()
+    if num_shards is None:
+        num_shards = 4 * num_workers
+    bounds = np.linspace(0, num_traj, min(num_shards, max(num_traj, 1)) + 1).astype(int)
+
+    shared = {}
+    try:
+        for key, array in inputs.items():
+            shared[key] = _to_shared_memory(array)
+        shared_arrays = {key: meta for key, (_, meta) in shared.items()}
+        shard_args = [
+            (shared_arrays, t0, t1, max_res, resolution, fill_gaps)
+            for t0, t1 in zip(bounds[:-1], bounds[1:])
+        ]
+        if executor is not None:
+            results = list(executor.map(_process_shard, *zip(*shard_args)))
+        elif num_workers == 1:
+            results = [_process_shard(*args) for args in shard_args]
+        else:
+            with _process_pool(num_workers) as pool:
+                results = list(pool.map(_process_shard, *zip(*shard_args)))
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+    results.sort(key=lambda result: result[0])
+    lengths = np.concatenate([np.empty(0, np.int64)] + [r[1] for r in results])
+    cells = np.concatenate([np.empty(0, np.uint64)] + [r[2] for r in results])
+    seq_offsets = np.zeros(num_traj + 1, dtype=np.int64)
+    np.cumsum(lengths, out=seq_offsets[1:])
+    traj_index = pd.Index(traj[offsets[:-1]], name=df.index.names[0])
+
+    if return_codes:
+        return cells, seq_offsets, traj_index
+
+    cell_strings = np.array(
+        [format(cell, "x") for cell in cells.tolist()], dtype=object
+    )
+    return pd.Series(
+        [
+            list(cell_strings[seq_offsets[i] : seq_offsets[i + 1]])
+            for i in range(num_traj)
+        ],
+        index=traj_index,
+        dtype=object,
+    )
+
+
+def chunked_h3_sequences(chunks, **kwargs):
+    """Turn trajectories into H3 sequences chunk by chunk.
+
+    Only one chunk of raw trajectory data is held in memory at a time, e.g. when
+    reading with data_loading.iter_labsea_trajectory_chunks. Trajectories must
+    not be split across chunks.
+
+    Parameters
+    ----------
+    chunks: iterable of pandas.DataFrame
+        Trajectory data as expected by sharded_h3_sequences.
+
+    All keyword arguments are passed to sharded_h3_sequences. A single pool of
+    worker processes is used for all chunks.
+
+    Returns
+    -------
+    pandas.Series
+        Each element contains an ordered collection (list) of h3s. Index is "traj".
+
+    """
+    num_workers = kwargs.pop("num_workers", None) or os.cpu_count()
+    if num_workers == 1:
+        sequences = [
+            sharded_h3_sequences(chunk, num_workers=1, **kwargs) for chunk in chunks
+        ]
+    else:
+        with _process_pool(num_workers) as pool:
+            sequences = [
+                sharded_h3_sequences(
+                    chunk, num_workers=num_workers, executor=pool, **kwargs
+                )
+                for chunk in chunks
+            ]
+    if not sequences:
+        return pd.Series([], index=pd.Index([], name="traj"), dtype=object)
+    return pd.concat(sequences)
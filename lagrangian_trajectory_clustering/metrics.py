@@ -1,6 +1,6 @@
 import numpy as np
 
-from numba import jit
+from numba import jit, njit
 
 
 def lcs_numpy(x, y):
@@ -134,6 +134,203 @@ def levenshtein_numpy(x, y):
     return d[m, n]
 
 
+def levenshtein_bounded(x, y, max_distance):
+    """Calculate the Levenshtein distance between x and y up to a threshold.
+
+    Only the diagonal band of width max_distance of the DP matrix is evaluated
+    and the calculation stops as soon as all cells of a row exceed the threshold.
+
+    See <https://en.wikipedia.org/wiki/Wagner%E2%80%93Fischer_algorithm> and
+    Ukkonen (1985) <https://doi.org/10.1016/S0019-9958(85)80046-2>.
+
+    Parameters
+    ----------
+    x: iterable
+        First sequence.
+    y: iterable
+        Second sequence.
+    max_distance: int
+        Largest distance which needs to be resolved.
+
+    Returns
+    -------
+    int
+        Levenshtein distance if it is not larger than max_distance,
+        max_distance + 1 otherwise.
+
+    """
+    m = len(x)
+    n = len(y)
+    too_far = max_distance + 1
+    if abs(m - n) > max_distance:
+        return too_far
+
+    prev = np.empty(n + 1, dtype=np.int64)
+    curr = np.empty(n + 1, dtype=np.int64)
+    for j in range(n + 1):
+        prev[j] = j if j <= max_distance else too_far
+
+    for i in range(1, m + 1):
+        lo = max(1, i - max_distance)
+        hi = min(n, i + max_distance)
+        curr[0] = i if i <= max_distance else too_far
+        curr[lo - 1] = curr[0] if lo == 1 else too_far
+        row_min = curr[lo - 1]
+        for j in range(lo, hi + 1):
+            if x[i - 1] == y[j - 1]:
+                cost = 0
+            else:
+                cost = 1
+            d = prev[j - 1] + cost
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if curr[j - 1] + 1 < d:
+                d = curr[j - 1] + 1
+            if d > too_far:
+                d = too_far
+            curr[j] = d
+            if d < row_min:
+                row_min = d
+        if hi < n:
+            curr[hi + 1] = too_far
+        if row_min > max_distance:
+            return too_far
+        prev, curr = curr, prev
+
+    return min(prev[n], too_far)
+
+
+@njit
+def _local_cell_distances(
+    x, neighbour_offsets, neighbour_codes, neighbour_distances, max_cell_distance
+):
+    """Tabulate the distances of all cells near x to each element of x.
+
+    Returns slot (cell code -> column, 0 for all cells not near x) and a
+    (len(x), num_slots) table of grid distances capped at max_cell_distance.
+
+    """
+    slot = np.zeros(len(neighbour_offsets) - 1, dtype=np.int64)
+    num_slots = 1
+    for a in x:
+        if slot[a] == 0:
+            slot[a] = num_slots
+            num_slots += 1
+        for k in range(neighbour_offsets[a], neighbour_offsets[a + 1]):
+            if slot[neighbour_codes[k]] == 0:
+                slot[neighbour_codes[k]] = num_slots
+                num_slots += 1
+    local = np.full((len(x), num_slots), max_cell_distance, dtype=np.uint8)
+    for i in range(len(x)):
+        a = x[i]
+        local[i, slot[a]] = 0
+        for k in range(neighbour_offsets[a], neighbour_offsets[a + 1]):
+            local[i, slot[neighbour_codes[k]]] = neighbour_distances[k]
+    return slot, local
+
+
+@njit
+def _weighted_levenshtein_local(y, slot, local, max_cell_distance, max_distance):
+    m = local.shape[0]
+    n = len(y)
+    if abs(m - n) > max_distance:
+        return np.inf
+    if max_distance == np.inf:
+        band = m + n
+    else:
+        band = int(max_distance)
+    scale = 1.0 / max_cell_distance
+
+    y_slots = np.empty(n, dtype=np.int64)
+    for j in range(n):
+        y_slots[j] = slot[y[j]]
+
+    prev = np.empty(n + 1, dtype=np.float64)
+    curr = np.empty(n + 1, dtype=np.float64)
+    for j in range(n + 1):
+        prev[j] = j
+
+    for i in range(1, m + 1):
+        costs = local[i - 1]
+        lo = max(1, i - band)
+        hi = min(n, i + band)
+        curr[0] = i
+        if lo > 1:
+            curr[lo - 1] = np.inf
+        row_min = curr[lo - 1]
+        for j in range(lo, hi + 1):
+            d = min(
+                prev[j - 1] + costs[y_slots[j - 1]] * scale,
+                prev[j] + 1,
+                curr[j - 1] + 1,
+            )
+            curr[j] = d
+            if d < row_min:
+                row_min = d
+        if hi < n:
+            curr[hi + 1] = np.inf
+        if row_min > max_distance:
+            return np.inf
+        prev, curr = curr, prev
+
+    if prev[n] > max_distance:
+        return np.inf
+    return prev[n]
+
+
+@njit
+def weighted_levenshtein(
+    x,
+    y,
+    neighbour_offsets,
+    neighbour_codes,
+    neighbour_distances,
+    max_cell_distance,
+    max_distance=np.inf,
+):
+    """Calculate a Levenshtein distance with distance-dependent substitution cost.
+
+    Insertions and deletions cost 1. Substituting cell a by cell b costs
+    min(d(a, b), max_cell_distance) / max_cell_distance where d is the grid
+    distance looked up from a neighbour table (see h3_trafo.h3_cell_distance_table).
+    With max_cell_distance=1, this is the plain Levenshtein distance.
+
+    Before the DP, the neighbour table is gathered into a small dense table
+    for all cells near x, so that each substitution cost is a single lookup.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First sequence of integer cell codes.
+    y: numpy.ndarray
+        Second sequence of integer cell codes.
+    neighbour_offsets: numpy.ndarray
+        Neighbours of cell i are at positions neighbour_offsets[i]:neighbour_offsets[i + 1].
+    neighbour_codes: numpy.ndarray
+        Codes of the neighbours, sorted for each cell.
+    neighbour_distances: numpy.ndarray
+        Grid distances to the neighbours.
+    max_cell_distance: int
+        Grid distance from which on substitution costs 1. Needs to be in 1..255.
+    max_distance: float
+        Stop early and return inf if the distance is known to be larger.
+        Defaults to inf.
+
+    Returns
+    -------
+    float
+        Weighted Levenshtein distance.
+
+    """
+    if max_cell_distance < 1 or max_cell_distance > 255:
+        raise ValueError("max_cell_distance needs to be in 1..255")
+    slot, local = _local_cell_distances(
+        x, neighbour_offsets, neighbour_codes, neighbour_distances, max_cell_distance
+    )
+    return _weighted_levenshtein_local(y, slot, local, max_cell_distance, max_distance)
+
+
 lcs_numpy_numba = jit(lcs_numpy)
 lcs_pure_numba = jit(lcs_pure)
 levenshtein_numpy_numba = jit(levenshtein_numpy)
+levenshtein_bounded_numba = jit(levenshtein_bounded)
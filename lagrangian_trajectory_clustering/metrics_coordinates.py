@@ -0,0 +1,360 @@
+"""Trajectory metrics on latitude / longitude arrays.
+
+All metrics take arrays of shape (n, 2) containing latitude and longitude in
+degrees and use the haversine distance (in kilometers) as ground distance.
+
+"""
+
+import numpy as np
+
+from numba import njit
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@njit
+def haversine(lat0, lon0, lat1, lon1):
+    """Calculate the great-circle distance between two points.
+
+    Parameters
+    ----------
+    lat0, lon0: float
+        Latitude and longitude of the first point in degrees.
+    lat1, lon1: float
+        Latitude and longitude of the second point in degrees.
+
+    Returns
+    -------
+    float
+        Distance in kilometers.
+
+    """
+    phi0 = np.deg2rad(lat0)
+    phi1 = np.deg2rad(lat1)
+    hav = (
+        np.sin((phi1 - phi0) / 2) ** 2
+        + np.cos(phi0) * np.cos(phi1) * np.sin(np.deg2rad(lon1 - lon0) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(min(hav, 1.0)))
+
+
+@njit
+def _haversine_to_box_lower_bound(lat, lon, lat_lo, lat_hi, lon_lo, lon_hi):
+    """Lower bound of the distance of a point to any point in a lat/lon box."""
+    if lat < lat_lo:
+        dlat = lat_lo - lat
+    elif lat > lat_hi:
+        dlat = lat - lat_hi
+    else:
+        dlat = 0.0
+    if lon_lo <= lon <= lon_hi:
+        dlon = 0.0
+    else:
+        dlon_lo = abs(lon - lon_lo) % 360.0
+        dlon_hi = abs(lon - lon_hi) % 360.0
+        dlon = min(
+            min(dlon_lo, 360.0 - dlon_lo),
+            min(dlon_hi, 360.0 - dlon_hi),
+        )
+    # hav(d) = hav(dlat) + cos(lat) cos(lat') hav(dlon) with cos(lat') >= the
+    # smallest cosine in the box (which is at one of its edges)
+    min_cos = min(np.cos(np.deg2rad(lat_lo)), np.cos(np.deg2rad(lat_hi)))
+    hav = (
+        np.sin(np.deg2rad(dlat) / 2) ** 2
+        + np.cos(np.deg2rad(lat))
+        * max(min_cos, 0.0)
+        * np.sin(np.deg2rad(dlon) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(min(hav, 1.0)))
+
+
+@njit
+def _effective_window(m, n, window):
+    if window < 0:
+        return max(m, n)
+    return max(window, abs(m - n))
+
+
+@njit
+def dtw(x, y, window=-1, max_distance=np.inf):
+    """Calculate the dynamic time warping distance of x and y.
+
+    See Berndt and Clifford (1994) and Sakoe and Chiba (1978)
+    <https://doi.org/10.1109/TASSP.1978.1163055>.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+    window: int
+        Width of the Sakoe-Chiba band. It's widened to at least abs(m - n).
+        Negative values (the default) mean no window.
+    max_distance: float
+        Stop early and return inf if the distance is known to be larger.
+        Defaults to inf.
+
+    Returns
+    -------
+    float
+        Sum of haversine distances along the optimal warping path in kilometers.
+
+    """
+    m = len(x)
+    n = len(y)
+    if m == 0 or n == 0:
+        return 0.0 if m == n else np.inf
+    w = _effective_window(m, n, window)
+    prev = np.full(n + 1, np.inf)
+    curr = np.full(n + 1, np.inf)
+    prev[0] = 0.0
+    for i in range(1, m + 1):
+        curr[:] = np.inf
+        row_min = np.inf
+        for j in range(max(1, i - w), min(n, i + w) + 1):
+            cost = haversine(x[i - 1, 0], x[i - 1, 1], y[j - 1, 0], y[j - 1, 1])
+            curr[j] = cost + min(prev[j - 1], prev[j], curr[j - 1])
+            row_min = min(row_min, curr[j])
+        if row_min > max_distance:
+            return np.inf
+        prev, curr = curr, prev
+    return prev[n]
+
+
+@njit
+def discrete_frechet(x, y, max_distance=np.inf):
+    """Calculate the discrete Fréchet distance of x and y.
+
+    See Eiter and Mannila (1994).
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+    max_distance: float
+        Stop early and return inf if the distance is known to be larger.
+        Defaults to inf.
+
+    Returns
+    -------
+    float
+        Discrete Fréchet distance in kilometers.
+
+    """
+    m = len(x)
+    n = len(y)
+    if m == 0 or n == 0:
+        return 0.0 if m == n else np.inf
+    prev = np.full(n + 1, np.inf)
+    curr = np.full(n + 1, np.inf)
+    prev[0] = 0.0
+    for i in range(1, m + 1):
+        curr[0] = np.inf
+        row_min = np.inf
+        for j in range(1, n + 1):
+            cost = haversine(x[i - 1, 0], x[i - 1, 1], y[j - 1, 0], y[j - 1, 1])
+            curr[j] = max(cost, min(prev[j - 1], prev[j], curr[j - 1]))
+            row_min = min(row_min, curr[j])
+        if row_min > max_distance:
+            return np.inf
+        prev, curr = curr, prev
+    return prev[n]
+
+
+@njit
+def edr(x, y, eps):
+    """Calculate the edit distance on real sequences of x and y.
+
+    Two points match if they are not further than eps apart.
+    See Chen, Özsu and Oria (2005) <https://doi.org/10.1145/1066157.1066213>.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+    eps: float
+        Matching threshold in kilometers.
+
+    Returns
+    -------
+    int
+        Number of edits needed to turn x into y.
+
+    """
+    m = len(x)
+    n = len(y)
+    prev = np.arange(n + 1)
+    curr = np.empty(n + 1, dtype=prev.dtype)
+    for i in range(1, m + 1):
+        curr[0] = i
+        for j in range(1, n + 1):
+            if haversine(x[i - 1, 0], x[i - 1, 1], y[j - 1, 0], y[j - 1, 1]) <= eps:
+                cost = 0
+            else:
+                cost = 1
+            curr[j] = min(prev[j - 1] + cost, prev[j] + 1, curr[j - 1] + 1)
+        prev, curr = curr, prev
+    return prev[n]
+
+
+@njit
+def lcss(x, y, eps, window=-1):
+    """Calculate the longest-common-subsequence distance of x and y.
+
+    Two points match if they are not further than eps apart and if their
+    positions along the trajectories differ by at most window.
+    See Vlachos, Kollios and Gunopulos (2002) <https://doi.org/10.1109/ICDE.2002.994784>.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+    eps: float
+        Matching threshold in kilometers.
+    window: int
+        Max. difference of positions of matching points. Negative values (the
+        default) mean no window.
+
+    Returns
+    -------
+    float
+        1 - LCSS / min(m, n).
+
+    """
+    m = len(x)
+    n = len(y)
+    if m == 0 or n == 0:
+        return 0.0 if m == n else 1.0
+    w = max(m, n) if window < 0 else window
+    prev = np.zeros(n + 1, dtype=np.int64)
+    curr = np.zeros(n + 1, dtype=np.int64)
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if (
+                abs(i - j) <= w
+                and haversine(x[i - 1, 0], x[i - 1, 1], y[j - 1, 0], y[j - 1, 1]) <= eps
+            ):
+                curr[j] = prev[j - 1] + 1
+            else:
+                curr[j] = max(prev[j], curr[j - 1])
+        prev, curr = curr, prev
+    return 1.0 - prev[n] / min(m, n)
+
+
+@njit
+def lb_kim(x, y):
+    """Lower bound of the DTW distance of x and y from their end points.
+
+    See Kim, Park and Chu (2001) <https://doi.org/10.1109/ICDE.2001.914875>.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+
+    Returns
+    -------
+    float
+        Lower bound in kilometers.
+
+    """
+    m = len(x)
+    n = len(y)
+    if m == 0 or n == 0:
+        return 0.0
+    first = haversine(x[0, 0], x[0, 1], y[0, 0], y[0, 1])
+    if m == 1 and n == 1:
+        return first
+    return first + haversine(x[-1, 0], x[-1, 1], y[-1, 0], y[-1, 1])
+
+
+@njit
+def lb_keogh(x, y, window=-1):
+    """Lower bound of the DTW distance of x and y from the envelope of y.
+
+    For each point of x, the distance to the lat/lon bounding box of all points
+    of y within the Sakoe-Chiba window is bounded from below.
+    See Keogh and Ratanamahatana (2005) <https://doi.org/10.1007/s10115-004-0154-9>.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+    window: int
+        Width of the Sakoe-Chiba band as used for dtw.
+
+    Returns
+    -------
+    float
+        Lower bound in kilometers.
+
+    """
+    m = len(x)
+    n = len(y)
+    if m == 0 or n == 0:
+        return 0.0
+    w = _effective_window(m, n, window)
+    bound = 0.0
+    for i in range(1, m + 1):
+        lo = max(1, i - w) - 1
+        hi = min(n, i + w)
+        bound += _haversine_to_box_lower_bound(
+            x[i - 1, 0],
+            x[i - 1, 1],
+            y[lo:hi, 0].min(),
+            y[lo:hi, 0].max(),
+            y[lo:hi, 1].min(),
+            y[lo:hi, 1].max(),
+        )
+    return bound
+
+
+@njit
+def frechet_lower_bound(x, y):
+    """Lower bound of the discrete Fréchet distance of x and y.
+
+    Uses the distances of the end points and the distances of all points of
+    each trajectory to the bounding box of the other trajectory.
+
+    Parameters
+    ----------
+    x: numpy.ndarray
+        First trajectory (latitude, longitude) of shape (m, 2).
+    y: numpy.ndarray
+        Second trajectory (latitude, longitude) of shape (n, 2).
+
+    Returns
+    -------
+    float
+        Lower bound in kilometers.
+
+    """
+    if len(x) == 0 or len(y) == 0:
+        return 0.0
+    bound = max(
+        haversine(x[0, 0], x[0, 1], y[0, 0], y[0, 1]),
+        haversine(x[-1, 0], x[-1, 1], y[-1, 0], y[-1, 1]),
+    )
+    for a, b in ((x, y), (y, x)):
+        lat_lo, lat_hi = b[:, 0].min(), b[:, 0].max()
+        lon_lo, lon_hi = b[:, 1].min(), b[:, 1].max()
+        for i in range(len(a)):
+            bound = max(
+                bound,
+                _haversine_to_box_lower_bound(
+                    a[i, 0], a[i, 1], lat_lo, lat_hi, lon_lo, lon_hi
+                ),
+            )
+    return bound
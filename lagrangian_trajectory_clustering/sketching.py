@@ -0,0 +1,245 @@
+"""MinHash sketches of H3 sequences and locality-sensitive hashing (LSH).
+
+Each sequence is reduced to the set of its k-shingles (k consecutive cells).
+The MinHash signature of this set has num_perm entries, each of which agrees
+for two sequences with a probability equal to the Jaccard similarity of their
+shingle sets. With LSH banding, signatures are cut into num_bands bands of
+num_perm / num_bands rows and sequences with at least one identical band
+become candidate neighbours. A pair with Jaccard similarity s becomes a
+candidate with probability 1 - (1 - s**rows)**num_bands. So more bands (with
+fewer rows each) increase recall at the cost of more candidate pairs.
+
+See Broder (1997) <https://doi.org/10.1109/SEQUEN.1997.666900> and Leskovec,
+Rajaraman and Ullman, Mining of Massive Datasets, chapter 3.
+
+"""
+
+from functools import partial
+
+import numpy as np
+
+from numba import njit, prange
+
+from .distance_matrix import _iter_edist_blocks, _to_sparse
+
+
+@njit
+def _mix(z):
+    # splitmix64 finalizer
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+@njit(parallel=True)
+def _minhash_signatures(codes, offsets, seeds, shingle_size):
+    num_sequences = len(offsets) - 1
+    signatures = np.full(
+        (num_sequences, len(seeds)), np.uint64(0xFFFFFFFFFFFFFFFF), dtype=np.uint64
+    )
+    for s in prange(num_sequences):
+        seq = codes[offsets[s] : offsets[s + 1]]
+        # sequences shorter than shingle_size form a single shingle
+        num_shingles = max(len(seq) - shingle_size + 1, min(len(seq), 1))
+        for k in range(num_shingles):
+            shingle = np.uint64(0)
+            for t in range(k, min(k + shingle_size, len(seq))):
+                shingle = _mix(shingle ^ np.uint64(seq[t]))
+            for p in range(len(seeds)):
+                value = _mix(shingle ^ seeds[p])
+                if value < signatures[s, p]:
+                    signatures[s, p] = value
+    return signatures
+
+
+@njit(parallel=True)
+def _band_keys(signatures, num_bands):
+    rows = signatures.shape[1] // num_bands
+    keys = np.empty((num_bands, signatures.shape[0]), dtype=np.uint64)
+    for s in prange(signatures.shape[0]):
+        for b in range(num_bands):
+            key = np.uint64(b)
+            for r in range(b * rows, (b + 1) * rows):
+                key = _mix(key ^ signatures[s, r])
+            keys[b, s] = key
+    return keys
+
+
+@njit
+def _bucket_pairs(order, sorted_keys, max_bucket_size):
+    num_pairs = 0
+    start = 0
+    for end in range(1, len(order) + 1):
+        if end == len(order) or sorted_keys[end] != sorted_keys[start]:
+            size = min(end - start, max_bucket_size)
+            num_pairs += size * (size - 1) // 2
+            start = end
+    pair_i = np.empty(num_pairs, dtype=np.int64)
+    pair_j = np.empty(num_pairs, dtype=np.int64)
+    p = 0
+    start = 0
+    for end in range(1, len(order) + 1):
+        if end == len(order) or sorted_keys[end] != sorted_keys[start]:
+            stop = start + min(end - start, max_bucket_size)
+            for a in range(start, stop):
+                for b in range(a + 1, stop):
+                    pair_i[p] = min(order[a], order[b])
+                    pair_j[p] = max(order[a], order[b])
+                    p += 1
+            start = end
+    return pair_i, pair_j
+
+
+def minhash_signatures(codes, offsets, num_perm=64, shingle_size=1, random_seed=0):
+    """Calculate MinHash signatures of the shingle sets of integer sequences.
+
+    Parameters
+    ----------
+    codes: numpy.ndarray
+        Flat integer codes of all sequences (see h3_trafo.h3_sequences_to_codes).
+    offsets: numpy.ndarray
+        Sequence i is codes[offsets[i]:offsets[i + 1]].
+    num_perm: int
+        Number of hash functions. Defaults to 64.
+    shingle_size: int
+        Number of consecutive cells per shingle. Defaults to 1 (sets of cells).
+    random_seed: int
+        Seed of the hash functions. Defaults to 0.
+
+    Returns
+    -------
+    numpy.ndarray
+        Signatures of shape (num_sequences, num_perm) and dtype uint64.
+
+    """
+    seeds = np.random.default_rng(random_seed).integers(
+        0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True
+    )
+    return _minhash_signatures(
+        np.asarray(codes, dtype=np.int64),
+        np.asarray(offsets, dtype=np.int64),
+        seeds,
+        shingle_size,
+    )
+
+
+def lsh_candidate_pairs(signatures, num_bands=32, max_bucket_size=None):
+    """Find pairs of sequences sharing at least one band of their signatures.
+
+    Parameters
+    ----------
+    signatures: numpy.ndarray
+        MinHash signatures of shape (num_sequences, num_perm).
+    num_bands: int
+        Number of bands. Must divide num_perm. Defaults to 32.
+    max_bucket_size: int
+        Optional. Only pair the first max_bucket_size sequences of each bucket
+        to limit the number of pairs of very common bands.
+
+    Returns
+    -------
+    pair_i, pair_j: numpy.ndarray
+        Distinct candidate pairs with pair_i < pair_j, sorted by pair_i.
+
+    """
+    num_sequences, num_perm = signatures.shape
+    if num_perm % num_bands:
+        raise ValueError(f"num_bands={num_bands} does not divide num_perm={num_perm}")
+    if max_bucket_size is None:
+        max_bucket_size = num_sequences
+
+    pairs = []
+    for keys in _band_keys(signatures, num_bands):
+        order = np.argsort(keys, kind="stable")
+        pair_i, pair_j = _bucket_pairs(order, keys[order], max_bucket_size)
+        pairs.append(pair_i * num_sequences + pair_j)
+    pairs = np.unique(np.concatenate([np.empty(0, np.int64)] + pairs))
+    return pairs // max(num_sequences, 1), pairs % max(num_sequences, 1)
+
+
+def _lsh_candidates(
+    codes, offsets, num_perm, num_bands, shingle_size, random_seed, max_bucket_size
+):
+    signatures = minhash_signatures(
+        codes,
+        offsets,
+        num_perm=num_perm,
+        shingle_size=shingle_size,
+        random_seed=random_seed,
+    )
+    return lsh_candidate_pairs(
+        signatures, num_bands=num_bands, max_bucket_size=max_bucket_size
+    )
+
+
+def approximate_edist_distance_matrix(
+    h3_sequences,
+    max_distance,
+    normalize=True,
+    num_perm=64,
+    num_bands=32,
+    shingle_size=1,
+    random_seed=0,
+    max_bucket_size=None,
+    max_cell_distance=None,
+    block_size=256,
+):
+    """Calculate edit distances of LSH candidate pairs of H3 sequences.
+
+    Only pairs found by lsh_candidate_pairs are compared with the exact
+    (thresholded) edit distance. The result is a subset of the sparse matrix of
+    distance_matrix.edist_distance_matrix with the same max_distance.
+
+    Parameters
+    ----------
+    h3_sequences: pandas.Series
+        Series of lists of h3s.
+    max_distance: float
+        Only distances not larger than max_distance are kept.
+    normalize: bool
+        Normalize edit distance (value 1 if complete sequence needs replacement).
+    num_perm: int
+        Length of the MinHash signatures. Defaults to 64.
+    num_bands: int
+        Number of LSH bands. More bands find more neighbours but also more
+        candidates to verify. Defaults to 32.
+    shingle_size: int
+        Number of consecutive cells per shingle. Defaults to 1.
+    random_seed: int
+        Seed of the hash functions. Defaults to 0.
+    max_bucket_size: int
+        Optional. Limit the pairs per LSH bucket (see lsh_candidate_pairs).
+    max_cell_distance: int
+        Optional. Weight substitutions with the grid distance of the cells
+        (see distance_matrix.edist_distance_matrix).
+    block_size: int
+        Number of rows processed at once. Defaults to 256.
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix
+        Square matrix of distances which explicitly stores all distances of
+        verified pairs not larger than max_distance (including zeros and the
+        diagonal).
+
+    """
+    rows, cols, values = [], [], []
+    for pair_i, pair_j, block_distances in _iter_edist_blocks(
+        h3_sequences,
+        normalize,
+        max_distance,
+        max_cell_distance,
+        block_size,
+        candidates=partial(
+            _lsh_candidates,
+            num_perm=num_perm,
+            num_bands=num_bands,
+            shingle_size=shingle_size,
+            random_seed=random_seed,
+            max_bucket_size=max_bucket_size,
+        ),
+    ):
+        rows.extend([pair_i, pair_j])
+        cols.extend([pair_j, pair_i])
+        values.extend([block_distances, block_distances])
+    return _to_sparse(rows, cols, values, len(h3_sequences))
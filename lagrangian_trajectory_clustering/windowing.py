@@ -0,0 +1,350 @@
+"""Sub-trajectories in sliding time windows.
+
+The H3 sequences of all trajectories are stored once in a flat array of
+integer codes, together with the time at which each cell is entered. The
+sequence of a trajectory within a time window is a contiguous slice of this
+store, so windows are represented by start and end positions only.
+
+Adjacent windows overlap and often contain the very same slices for most
+trajectories (at coarse resolutions, cells are left less frequently than the
+window is moved). Edit distances of pairs of unchanged slices are taken from
+the previous window instead of being recalculated.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+from h3.api import basic_int as h3_int
+from numba import njit, prange
+
+from .distance_matrix import _iter_upper_triangle_blocks, _to_sparse
+from .h3_trafo import h3_int_to_parent
+from .metrics import levenshtein_bounded_numba
+
+
+@njit
+def _window_bounds(times, offsets, last_times, t_start, t_end):
+    # a cell belongs to the window if it is occupied at any time in
+    # [t_start, t_end), i.e. also the cell occupied at t_start
+    num_traj = len(offsets) - 1
+    starts = np.empty(num_traj, dtype=np.int64)
+    ends = np.empty(num_traj, dtype=np.int64)
+    for t in range(num_traj):
+        first, last = offsets[t], offsets[t + 1]
+        if last == first or last_times[t] < t_start or times[first] >= t_end:
+            starts[t] = first
+            ends[t] = first
+            continue
+        traj_times = times[first:last]
+        starts[t] = first + max(
+            np.searchsorted(traj_times, t_start, side="right") - 1, 0
+        )
+        ends[t] = first + np.searchsorted(traj_times, t_end, side="left")
+    return starts, ends
+
+
+@njit(parallel=True)
+def _levenshtein_slice_pairs(codes, starts, ends, pair_i, pair_j, max_distances):
+    distances = np.empty(len(pair_i), dtype=np.int64)
+    for p in prange(len(pair_i)):
+        i = pair_i[p]
+        j = pair_j[p]
+        distances[p] = levenshtein_bounded_numba(
+            codes[starts[i] : ends[i]], codes[starts[j] : ends[j]], max_distances[p]
+        )
+    return distances
+
+
+class SlidingWindowSequences:
+    """H3 sequences of trajectories with views on sliding time windows.
+
+    Parameters
+    ----------
+    codes: numpy.ndarray
+        Flat integer codes of the H3 sequences of all trajectories.
+    times: numpy.ndarray
+        Time (datetime64[ns]) at which the cell of each code is entered.
+    offsets: numpy.ndarray
+        Trajectory i is codes[offsets[i]:offsets[i + 1]].
+    last_times: numpy.ndarray
+        Time of the last observation of each trajectory.
+    cells: numpy.ndarray
+        Distinct integer H3s. The code of an element is its position in cells.
+    traj: pandas.Index
+        Trajectory ids.
+
+    """
+
+    def __init__(self, codes, times, offsets, last_times, cells, traj):
+        self.codes = np.asarray(codes, dtype=np.int64)
+        self.times = np.asarray(times, dtype="datetime64[ns]")
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.last_times = np.asarray(last_times, dtype="datetime64[ns]")
+        self.cells = np.asarray(cells, dtype=np.uint64)
+        self.traj = pd.Index(traj)
+
+    @classmethod
+    def from_trajectories(cls, df, resolution=0, max_res=15):
+        """Build the store from trajectory data.
+
+        Subsequent identical cells are merged into one, which is entered at
+        the time of the first of them. Gaps between subsequent cells are not
+        filled, as the filled cells would have no time.
+
+        Parameters
+        ----------
+        df: pandas.DataFrame
+            Has columns "time" and "latitude" and "longitude" (or an existing
+            "h3maxres" column which will be used instead) and is indexed by
+            "traj" and "obs". Rows need to be sorted by trajectory and time.
+        resolution: int
+            H3 resolution of the sequences. Defaults to 0.
+        max_res: int
+            Resolution of the intermediate max. resolution cells. Defaults to 15.
+
+        Returns
+        -------
+        SlidingWindowSequences
+
+        """
+        traj = df.index.get_level_values(0).to_numpy()
+        times = df["time"].to_numpy(dtype="datetime64[ns]")
+        if "h3maxres" in df.columns:
+            cells = np.array(
+                [h3_int.string_to_h3(cell) for cell in df["h3maxres"]], dtype=np.uint64
+            )
+        else:
+            cells = np.fromiter(
+                (
+                    h3_int.geo_to_h3(lat, lon, max_res)
+                    for lat, lon in zip(df["latitude"], df["longitude"])
+                ),
+                dtype=np.uint64,
+                count=len(df),
+            )
+        cells = h3_int_to_parent(cells, resolution)
+
+        new_traj = np.r_[True, traj[1:] != traj[:-1]][: len(traj)]
+        traj_ends = np.r_[np.flatnonzero(new_traj)[1:], len(traj)] - 1
+        keep = new_traj | np.r_[True, cells[1:] != cells[:-1]][: len(cells)]
+        offsets = np.r_[0, np.cumsum(keep)[traj_ends]].astype(np.int64)
+
+        distinct_cells, codes = np.unique(cells[keep], return_inverse=True)
+        return cls(
+            codes,
+            times[keep],
+            offsets,
+            times[traj_ends],
+            distinct_cells,
+            pd.Index(traj[new_traj], name=df.index.names[0]),
+        )
+
+    def window_bounds(self, start, end):
+        """Find the slices of all trajectories in a time window.
+
+        Parameters
+        ----------
+        start, end: datetime-like
+            The window is [start, end).
+
+        Returns
+        -------
+        starts, ends: numpy.ndarray
+            The sequence of trajectory i is codes[starts[i]:ends[i]]. It contains
+            all cells which are occupied at some time in the window.
+
+        """
+        return _window_bounds(
+            self.times.view(np.int64),
+            self.offsets,
+            self.last_times.view(np.int64),
+            pd.Timestamp(start).as_unit("ns").value,
+            pd.Timestamp(end).as_unit("ns").value,
+        )
+
+    def windows(self, window, step, start=None, end=None, min_length=1):
+        """Iterate over sliding time windows.
+
+        Parameters
+        ----------
+        window: timedelta-like
+            Length of each window, e.g. "30D".
+        step: timedelta-like
+            Offset between the starts of subsequent windows.
+        start, end: datetime-like
+            Optional. First window starts at start, last window starts at or
+            before end. Default to the first and the last time in the store.
+        min_length: int
+            Only trajectories with at least min_length cells in a window are
+            included. Defaults to 1.
+
+        Yields
+        ------
+        window_start: pandas.Timestamp
+        active: numpy.ndarray
+            Positions of the trajectories included in the window.
+        starts, ends: numpy.ndarray
+            Sequence of active trajectory i is codes[starts[i]:ends[i]].
+
+        """
+        window = pd.Timedelta(window)
+        if start is None:
+            start = self.times.min()
+        if end is None:
+            end = self.times.max()
+        for window_start in pd.date_range(start, end, freq=pd.Timedelta(step)):
+            starts, ends = self.window_bounds(window_start, window_start + window)
+            active = np.flatnonzero(ends - starts >= max(min_length, 1))
+            yield window_start, active, starts[active], ends[active]
+
+    def to_h3_sequences(self, active, starts, ends):
+        """Turn (a window of) the store into a series of lists of h3s.
+
+        Parameters
+        ----------
+        active: numpy.ndarray
+            Positions of the trajectories.
+        starts, ends: numpy.ndarray
+            Slices of the trajectories as yielded by windows.
+
+        Returns
+        -------
+        pandas.Series
+            Each element contains an ordered collection (list) of h3s. Index is "traj".
+
+        """
+        cell_strings = np.array([format(cell, "x") for cell in self.cells.tolist()])
+        return pd.Series(
+            [list(cell_strings[self.codes[s:e]]) for s, e in zip(starts, ends)],
+            index=self.traj[active],
+            dtype=object,
+        )
+
+    def iter_window_distance_matrices(
+        self,
+        window,
+        step,
+        max_distance,
+        normalize=True,
+        start=None,
+        end=None,
+        min_length=1,
+        block_size=256,
+    ):
+        """Calculate sparse edit-distance matrices of sliding time windows.
+
+        Work is reused between subsequent windows: Turning the previous slice
+        of a trajectory into the current one takes at most as many edits as
+        cells were dropped or added at either end. So the previous distance of
+        a pair changes by at most the sum of these numbers for both
+        trajectories. Pairs of unchanged slices reuse their previous distance
+        and pairs which were too far apart and can't have come closer than
+        max_distance are skipped. All other pairs are calculated with a
+        threshold-pruned edit distance (see distance_matrix.edist_distance_matrix).
+
+        Parameters
+        ----------
+        window, step, start, end, min_length:
+            See windows.
+        max_distance: float
+            Only distances not larger than max_distance are kept.
+        normalize: bool
+            Normalize edit distance (value 1 if complete sequence needs replacement).
+        block_size: int
+            Number of rows processed at once. Defaults to 256.
+
+        Yields
+        ------
+        window_start: pandas.Timestamp
+        traj: pandas.Index
+            Trajectory ids of the rows and columns of the matrix.
+        distances: scipy.sparse.csr_matrix
+            Square matrix which explicitly stores all distances not larger than
+            max_distance (including zeros and the diagonal).
+        num_computed: int
+            Number of pairs whose edit distance was calculated.
+
+        """
+
+        def _thresholds(max_lengths):
+            # max. number of edits within max_distance
+            if normalize:
+                return np.floor(max_distance * max_lengths + 1e-9).astype(np.int64)
+            return np.full(len(max_lengths), int(np.floor(max_distance + 1e-9)))
+
+        # position of each trajectory in the previous window (-1 if absent)
+        prev_position = np.full(len(self.offsets) - 1, -1)
+        prev_starts = prev_ends = np.zeros(1, dtype=np.int64)
+        # pairs (as i * num_sequences + j) within max_distance and their edits
+        prev_keys = np.array([np.iinfo(np.int64).max])
+        prev_edits = np.zeros(1, dtype=np.int64)
+        prev_num_sequences = 0
+
+        for window_start, active, starts, ends in self.windows(
+            window, step, start=start, end=end, min_length=min_length
+        ):
+            num_sequences = len(active)
+            lengths = ends - starts
+            old = prev_position[active]
+            was_active = old >= 0
+            old = np.maximum(old, 0)
+            changes = np.abs(starts - prev_starts[old]) + np.abs(ends - prev_ends[old])
+            old_lengths = prev_ends[old] - prev_starts[old]
+
+            rows, cols, values, keys, edits = [], [], [], [], []
+            num_computed = 0
+            for pair_i, pair_j in _iter_upper_triangle_blocks(
+                num_sequences, block_size
+            ):
+                max_lengths = np.maximum(lengths[pair_i], lengths[pair_j])
+                thresholds = _thresholds(max_lengths)
+
+                both_active = was_active[pair_i] & was_active[pair_j]
+                old_keys = old[pair_i] * prev_num_sequences + old[pair_j]
+                k = np.searchsorted(prev_keys, old_keys)
+                was_close = both_active & (prev_keys[k] == old_keys)
+                slack = changes[pair_i] + changes[pair_j]
+                old_thresholds = _thresholds(
+                    np.maximum(old_lengths[pair_i], old_lengths[pair_j])
+                )
+
+                reuse = was_close & (slack == 0)
+                far = (
+                    both_active & ~was_close & (old_thresholds + 1 - slack > thresholds)
+                ) | (np.abs(lengths[pair_i] - lengths[pair_j]) > thresholds)
+                compute = ~reuse & ~far
+
+                pair_edits = np.where(reuse, prev_edits[k], thresholds + 1)
+                pair_edits[compute] = _levenshtein_slice_pairs(
+                    self.codes,
+                    starts,
+                    ends,
+                    pair_i[compute],
+                    pair_j[compute],
+                    thresholds[compute],
+                )
+                num_computed += compute.sum()
+
+                keep = pair_edits <= thresholds
+                pair_i, pair_j = pair_i[keep], pair_j[keep]
+                keys.append(pair_i * num_sequences + pair_j)
+                edits.append(pair_edits[keep])
+                block_distances = pair_edits[keep].astype(np.float64)
+                if normalize:
+                    block_distances /= max_lengths[keep] + 1e-15
+
+                rows.extend([pair_i, pair_j])
+                cols.extend([pair_j, pair_i])
+                values.extend([block_distances, block_distances])
+
+            distances = _to_sparse(rows, cols, values, num_sequences)
+            yield window_start, self.traj[active], distances, int(num_computed)
+
+            prev_position[:] = -1
+            prev_position[active] = np.arange(num_sequences)
+            prev_starts, prev_ends = np.r_[starts, 0], np.r_[ends, 0]
+            # with a sentinel, so that searchsorted always hits an element
+            prev_keys = np.concatenate(keys + [[np.iinfo(np.int64).max]])
+            prev_edits = np.concatenate(edits + [[0]])
+            prev_num_sequences = num_sequences
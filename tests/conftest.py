@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def make_h3_sequences():
+    """Factory of two well separated groups of sequences."""
+
+    def _make_h3_sequences(different_lengths=False):
+        group_a = ["ABCDEFGH", "ABCDEFGX", "ABCDEFXH", "XBCDEFGH", "ABCDEFG"]
+        group_b = ["STUVWXYZ", "STUVWXYA", "STUVWAYZ", "ATUVWXYZ", "TUVWXYZ"]
+        if different_lengths:
+            group_a.append("ABCDE")
+        return pd.Series(
+            [list(s) for s in group_a + group_b],
+            index=pd.Index(np.arange(len(group_a) + len(group_b)) * 10, name="traj"),
+        )
+
+    return _make_h3_sequences
+
+
+@pytest.fixture
+def h3_sequences(make_h3_sequences):
+    """Two well separated groups of five sequences each."""
+    return make_h3_sequences()
@@ -0,0 +1,104 @@
+import h3
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.aggregation import (
+    cluster_cell_matrix,
+    cluster_footprints_from_sequences,
+    cluster_footprints_from_trajectories,
+)
+from lagrangian_trajectory_clustering.h3_trafo import (
+    add_max_res_h3_column,
+    h3_series_to_h3_parent,
+    h3_series_to_series_of_h3_sequences,
+)
+
+
+@pytest.fixture
+def trajectories():
+    rng = np.random.default_rng(0)
+    num_traj, num_obs = 12, 30
+    steps = rng.normal(scale=0.5, size=(2, num_traj, num_obs))
+    time = np.datetime64("1993-01-01", "ns") + np.arange(num_obs) * np.timedelta64(
+        1, "D"
+    )
+    df = pd.DataFrame(
+        {
+            "time": np.tile(time, num_traj),
+            "latitude": (15 + np.cumsum(steps[0], axis=1)).ravel(),
+            "longitude": (-25 + np.cumsum(steps[1], axis=1)).ravel(),
+        },
+        index=pd.MultiIndex.from_product(
+            [np.arange(100, 100 + num_traj), np.arange(num_obs)], names=["traj", "obs"]
+        ),
+    )
+    df = add_max_res_h3_column(df, max_res=8)
+    cluster_ids = pd.Series(
+        np.arange(num_traj) % 3 - 1, index=np.arange(100, 100 + num_traj)
+    )
+    return df, cluster_ids
+
+
+def _groupby_reference(df, cluster_ids, resolution, include_noise):
+    """Footprints with pandas groupbys over string cell ids."""
+    df = df.assign(
+        cluster_ids=cluster_ids.reindex(df.index.get_level_values("traj")).to_numpy(),
+        h3=h3_series_to_h3_parent(df["h3maxres"], resolution).to_numpy(),
+        traj=df.index.get_level_values("traj"),
+    )
+    if not include_noise:
+        df = df[df["cluster_ids"] >= 0]
+    grouped = df.groupby(["cluster_ids", "h3"])
+    return pd.DataFrame(
+        {
+            "visits": grouped.size(),
+            "trajectories": grouped["traj"].nunique(),
+            "first_arrival": grouped["time"].min(),
+        }
+    )
+
+
+@pytest.mark.parametrize("resolution", [0, 3, 5])
+@pytest.mark.parametrize("include_noise", [True, False])
+def test_footprints_from_trajectories(trajectories, resolution, include_noise):
+    df, cluster_ids = trajectories
+    footprints = cluster_footprints_from_trajectories(
+        df, cluster_ids, resolution=resolution, include_noise=include_noise
+    )
+    expected = _groupby_reference(df, cluster_ids, resolution, include_noise)
+    pd.testing.assert_frame_equal(footprints, expected, check_dtype=False)
+    assert footprints.index.is_monotonic_increasing
+
+
+def test_footprints_from_sequences(trajectories):
+    df, cluster_ids = trajectories
+    h3_sequences = h3_series_to_series_of_h3_sequences(
+        h3_series_to_h3_parent(df["h3maxres"], 4)
+    )
+    footprints = cluster_footprints_from_sequences(h3_sequences, cluster_ids)
+    expected = _groupby_reference(df, cluster_ids, 4, False)
+    pd.testing.assert_frame_equal(
+        footprints, expected[["visits", "trajectories"]], check_dtype=False
+    )
+    coarse = cluster_footprints_from_sequences(h3_sequences, cluster_ids, resolution=2)
+    assert coarse["visits"].sum() == footprints["visits"].sum()
+    assert all(h3.h3_get_resolution(cell) == 2 for cell in coarse.index.levels[1])
+
+
+def test_cluster_cell_matrix(trajectories):
+    df, cluster_ids = trajectories
+    footprints = cluster_footprints_from_trajectories(df, cluster_ids, resolution=3)
+    matrix, clusters, cells = cluster_cell_matrix(footprints, column="trajectories")
+    assert list(clusters) == [0, 1]
+    assert matrix.shape == (2, len(cells))
+    for (cluster, cell), value in footprints["trajectories"].items():
+        assert matrix[clusters.get_loc(cluster), cells.get_loc(cell)] == value
+    assert matrix.nnz == len(footprints)
+
+
+def test_empty_footprints(trajectories):
+    df, cluster_ids = trajectories
+    footprints = cluster_footprints_from_trajectories(df, cluster_ids * 0 - 1)
+    assert len(footprints) == 0
+    assert list(footprints.columns) == ["visits", "trajectories", "first_arrival"]
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.cluster_model import EditDistanceClusterModel
+from lagrangian_trajectory_clustering.clustering import (
+    dbscan_with_edist_metric,
+    kmedoids_with_edist_metric,
+)
+
+
+@pytest.mark.parametrize("normalize", [True, False])
+def test_dbscan_model_reproduces_fit(h3_sequences, normalize):
+    eps = 0.3 if normalize else 2
+    cluster_ids, model = dbscan_with_edist_metric(
+        h3_sequences, eps=eps, min_samples=3, normalize=normalize, return_model=True
+    )
+    pd.testing.assert_series_equal(model.predict(h3_sequences), cluster_ids)
+
+
+def test_dbscan_model_predict_new(h3_sequences):
+    cluster_ids, model = dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=3, return_model=True
+    )
+    new_sequences = pd.Series(
+        [list("ABCDEFGQ"), list("STUVWXQZ"), list("QQQQQQQQ"), []],
+        index=["a", "b", "c", "d"],
+    )
+    predicted = model.predict(new_sequences)
+    assert predicted["a"] == cluster_ids.iloc[0]
+    assert predicted["b"] == cluster_ids.iloc[5]
+    assert predicted["c"] == -1
+    assert predicted["d"] == -1
+
+
+def test_kmedoids_model_predict(h3_sequences):
+    cluster_ids, medoids, model = kmedoids_with_edist_metric(
+        h3_sequences, n_clusters=2, random_seed=0, return_model=True
+    )
+    pd.testing.assert_series_equal(model.predict(h3_sequences), cluster_ids)
+    assert model.predict(pd.Series([list("QQQQQQQQ")])).iloc[0] in (0, 1)
+
+
+def test_model_save_load(h3_sequences, tmp_path):
+    _, model = dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=3, return_model=True
+    )
+    model.save(tmp_path / "model.npz")
+    loaded = EditDistanceClusterModel.load(tmp_path / "model.npz")
+    assert loaded.eps == model.eps
+    np.testing.assert_array_equal(loaded.labels, model.labels)
+    pd.testing.assert_series_equal(
+        loaded.predict(h3_sequences), model.predict(h3_sequences)
+    )
+
+
+def test_model_save_load_integer_cells(h3_sequences, tmp_path):
+    cells = {cell: i for i, cell in enumerate(sorted(set(h3_sequences.sum())))}
+    int_sequences = h3_sequences.map(lambda seq: [cells[cell] for cell in seq])
+    _, model = dbscan_with_edist_metric(
+        int_sequences, eps=0.3, min_samples=3, return_model=True
+    )
+    model.save(tmp_path / "model")
+    loaded = EditDistanceClusterModel.load(tmp_path / "model")
+    assert loaded.cells.dtype == model.cells.dtype
+    pd.testing.assert_series_equal(
+        loaded.predict(int_sequences), model.predict(int_sequences)
+    )
+    assert (loaded.predict(int_sequences) >= 0).all()
+
+
+def test_model_without_representatives(h3_sequences):
+    cluster_ids, model = dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=20, return_model=True
+    )
+    assert (cluster_ids == -1).all()
+    assert (model.predict(h3_sequences) == -1).all()
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import (
+    dbscan_with_edist_metric,
+    hdbscan_with_edist_metric,
+    kmedoids_with_edist_metric,
+)
+from lagrangian_trajectory_clustering.distance_matrix import edist_distance_matrix
+
+
+@pytest.mark.parametrize("normalize", [True, False])
+def test_edist_distance_matrix_sparse_matches_dense(h3_sequences, normalize):
+    dense = edist_distance_matrix(h3_sequences, normalize=normalize)
+    max_distance = 0.3 if normalize else 2
+    sparse = edist_distance_matrix(
+        h3_sequences, normalize=normalize, max_distance=max_distance
+    )
+    expected = np.where(dense <= max_distance, dense, 0)
+    np.testing.assert_allclose(sparse.toarray(), expected)
+    assert sparse.nnz == (dense <= max_distance).sum()
+
+
+def test_edist_distance_matrix_memmap(h3_sequences, tmp_path):
+    dense = edist_distance_matrix(h3_sequences)
+    mapped = edist_distance_matrix(h3_sequences, memmap_path=tmp_path / "d.npy")
+    np.testing.assert_array_equal(dense, np.load(tmp_path / "d.npy"))
+    np.testing.assert_array_equal(dense, mapped)
+
+
+def test_kmedoids_with_edist_metric(h3_sequences):
+    cluster_ids, medoids = kmedoids_with_edist_metric(
+        h3_sequences, n_clusters=2, random_seed=0
+    )
+    assert cluster_ids.name == "cluster_ids"
+    assert (cluster_ids.index == h3_sequences.index).all()
+    assert cluster_ids.iloc[:5].nunique() == 1
+    assert cluster_ids.iloc[5:].nunique() == 1
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[5]
+    for cluster_id, medoid_traj in enumerate(medoids.index):
+        assert cluster_ids.loc[medoid_traj] == cluster_id
+
+
+def test_hdbscan_with_edist_metric(h3_sequences):
+    cluster_ids = hdbscan_with_edist_metric(h3_sequences, min_cluster_size=3)
+    reference = dbscan_with_edist_metric(h3_sequences, eps=0.3, min_samples=3)
+    assert cluster_ids.name == "cluster_ids"
+    assert (cluster_ids.index == h3_sequences.index).all()
+    assert (cluster_ids.iloc[:5] == cluster_ids.iloc[0]).all()
+    assert (cluster_ids.iloc[5:] == cluster_ids.iloc[5]).all()
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[5]
+    assert reference.nunique() == cluster_ids.nunique()
+
+
+def test_kmedoids_with_edist_metric_single_cluster(h3_sequences):
+    dense = edist_distance_matrix(h3_sequences)
+    cluster_ids, medoids = kmedoids_with_edist_metric(
+        h3_sequences, n_clusters=1, random_seed=0
+    )
+    assert (cluster_ids == 0).all()
+    assert medoids.index[0] == h3_sequences.index[dense.sum(axis=0).argmin()]
+
+
+def test_kmedoids_with_edist_metric_rejects_sparse(h3_sequences):
+    distances = edist_distance_matrix(h3_sequences, max_distance=0.3)
+    with pytest.raises(TypeError, match="sparse"):
+        kmedoids_with_edist_metric(
+            h3_sequences, n_clusters=2, distance_matrix=distances
+        )
+
+
+@pytest.mark.parametrize("min_samples", [None, 2, 4])
+def test_hdbscan_with_edist_metric_sparse(h3_sequences, min_samples):
+    # the two groups are not connected within max_distance
+    distances = edist_distance_matrix(h3_sequences, max_distance=0.3)
+    cluster_ids = hdbscan_with_edist_metric(
+        h3_sequences,
+        distance_matrix=distances,
+        min_cluster_size=3,
+        min_samples=min_samples,
+    )
+    expected = hdbscan_with_edist_metric(
+        h3_sequences, min_cluster_size=3, min_samples=min_samples
+    )
+    pd.testing.assert_series_equal(cluster_ids, expected)
+
+
+def test_hdbscan_with_edist_metric_sparse_isolated(h3_sequences):
+    # a sequence without any neighbour within max_distance
+    h3_sequences = pd.concat([h3_sequences, pd.Series([list("QQQQQ")], index=[100])])
+    distances = edist_distance_matrix(h3_sequences, max_distance=0.3)
+    cluster_ids = hdbscan_with_edist_metric(
+        h3_sequences, distance_matrix=distances, min_cluster_size=3
+    )
+    assert (cluster_ids.iloc[:5] == cluster_ids.iloc[0]).all()
+    assert (cluster_ids.iloc[5:10] == cluster_ids.iloc[5]).all()
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[5]
+    assert cluster_ids.iloc[10] == -1
@@ -0,0 +1,149 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from lagrangian_trajectory_clustering import data_loading
+from lagrangian_trajectory_clustering.data_loading import (
+    iter_labsea_trajectory_chunks,
+    load_cape_verde_trajectories,
+    load_cape_verde_trajectories_multi_year,
+)
+from lagrangian_trajectory_clustering.h3_trafo_sharded import (
+    chunked_h3_sequences,
+    sharded_h3_sequences,
+)
+
+
+@pytest.fixture
+def labsea_store(tmp_path):
+    """Small local Zarr store laid out like the lab sea data."""
+    rng = np.random.default_rng(0)
+    num_traj, num_obs = 10, 8
+    lat = 58 + np.cumsum(rng.normal(scale=0.3, size=(num_traj, num_obs)), axis=1)
+    lon = -50 + np.cumsum(rng.normal(scale=0.3, size=(num_traj, num_obs)), axis=1)
+    # trajectories ending early are padded with NaN
+    lat[2, 5:] = np.nan
+    lon[2, 5:] = np.nan
+    lat[7, 1:] = np.nan
+    lon[7, 1:] = np.nan
+    time = np.datetime64("1990-01-01", "ns") - np.arange(num_obs) * np.timedelta64(
+        1, "D"
+    )
+    ds = xr.Dataset(
+        {
+            "lat": (("traj", "obs"), lat),
+            "lon": (("traj", "obs"), lon),
+            "time": (("traj", "obs"), np.tile(time, (num_traj, 1))),
+        }
+    )
+    for var in ds.data_vars:
+        ds[var].encoding["chunks"] = (3, num_obs)
+    store = tmp_path / "labsea.zarr"
+    ds.to_zarr(store)
+    return store, ds
+
+
+def test_iter_labsea_trajectory_chunks(labsea_store):
+    store, ds = labsea_store
+    chunks = list(iter_labsea_trajectory_chunks(store))
+    assert len(chunks) == 4
+    df = pd.concat(chunks)
+    expected = (
+        ds.to_dataframe()
+        .dropna(subset=["lat", "lon"])
+        .rename(columns={"lat": "latitude", "lon": "longitude"})
+    )
+    assert df.index.is_monotonic_increasing
+    assert len(df) == 10 * 8 - 3 - 7
+    pd.testing.assert_frame_equal(df, expected[df.columns], check_index_type=False)
+
+
+def test_iter_labsea_trajectory_chunks_options(labsea_store):
+    store, _ = labsea_store
+    chunks = list(
+        iter_labsea_trajectory_chunks(store, num_traj=7, chunk_size=5, as_arrays=True)
+    )
+    # chunk size is rounded to multiples of the native chunks
+    assert [np.unique(chunk["traj"]).tolist() for chunk in chunks] == [
+        [0, 1, 2, 3, 4, 5],
+        [6],
+    ]
+    assert set(chunks[0]) == {"traj", "obs", "time", "latitude", "longitude"}
+
+
+def test_chunked_h3_sequences(labsea_store):
+    store, _ = labsea_store
+    sequences = chunked_h3_sequences(
+        iter_labsea_trajectory_chunks(store), resolution=3, num_workers=1
+    )
+    expected = sharded_h3_sequences(
+        pd.concat(iter_labsea_trajectory_chunks(store)), resolution=3, num_workers=1
+    )
+    assert sequences.index.equals(expected.index)
+    assert sequences.tolist() == expected.tolist()
+
+
+def test_chunked_h3_sequences_without_chunks():
+    sequences = chunked_h3_sequences(iter([]), resolution=3, num_workers=1)
+    assert len(sequences) == 0
+    assert sequences.index.name == "traj"
+
+
+@pytest.fixture(params=["c", "pyarrow"])
+def cape_verde_cache(request, tmp_path, monkeypatch):
+    """Pre-populated local cache standing in for the Zenodo files.
+
+    Parametrized with the csv parser to use.
+    """
+    if request.param == "pyarrow":
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(data_loading, "_CSV_ENGINE", request.param)
+    rng = np.random.default_rng(0)
+    files = {}
+    for year, num_traj in ((1993, 4), (1994, 3), (1995, 5)):
+        num_obs = 6
+        df = pd.DataFrame(
+            {
+                "traj": np.repeat(np.arange(num_traj), num_obs),
+                "obs": np.tile(np.arange(num_obs), num_traj),
+                "time": np.tile(
+                    pd.date_range(f"{year}-01-01", periods=num_obs, freq="D"),
+                    num_traj,
+                ),
+                "lat": 15 + rng.normal(size=num_traj * num_obs),
+                "lon": -25 + rng.normal(size=num_traj * num_obs),
+                "z": 0.0,
+            }
+        ).sample(frac=1, random_state=year)
+        files[year] = tmp_path / f"cape_verde_drift_trajectories_1-10000_{year}.csv.gz"
+        df.to_csv(files[year], index=False)
+
+    def retrieve(url, path, known_hash):
+        year = int(url[-11:-7])
+        return str(files[year])
+
+    monkeypatch.setattr(data_loading, "retrieve", retrieve)
+    return files
+
+
+def test_multi_year_matches_single_year_loads(cape_verde_cache):
+    years = [1993, 1994, 1995]
+    df, timings = load_cape_verde_trajectories_multi_year(
+        years, max_workers=2, return_timings=True
+    )
+    assert list(df.columns) == ["time", "latitude", "longitude"]
+    assert df["time"].dtype == "datetime64[ns]"
+    assert df.index.is_monotonic_increasing
+    assert df.index.is_unique
+
+    for year in years:
+        single = load_cape_verde_trajectories(year)
+        offset = timings.loc[year, "traj_offset"]
+        part = df.loc[offset : offset + single.index.levels[0].max()]
+        part.index = part.index.set_levels(part.index.levels[0] - offset, level=0)
+        pd.testing.assert_frame_equal(part, single, check_index_type=False)
+
+    assert list(timings["traj_offset"]) == [0, 4, 7]
+    assert list(timings["rows"]) == [24, 18, 30]
+    assert (timings[["retrieve", "parse"]] >= 0).all().all()
@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import (
+    dbscan_with_edist_metric,
+    hdbscan_with_edist_metric,
+    kmedoids_with_edist_metric,
+    optics_with_edist_metric,
+)
+from lagrangian_trajectory_clustering.distance_matrix import (
+    CondensedDistanceMatrix,
+    edist_distance_matrix,
+)
+
+
+@pytest.fixture
+def h3_sequences(make_h3_sequences):
+    return make_h3_sequences(different_lengths=True)
+
+
+@pytest.mark.parametrize("normalize", [True, False])
+@pytest.mark.parametrize("dtype", ["uint16", "float32"])
+@pytest.mark.parametrize("storage", [None, "d.npy", "d.zarr"])
+def test_condensed_matches_dense(h3_sequences, normalize, dtype, storage, tmp_path):
+    dense = edist_distance_matrix(h3_sequences, normalize=normalize)
+    path = None if storage is None else tmp_path / storage
+    condensed = CondensedDistanceMatrix.from_h3_sequences(
+        h3_sequences, normalize=normalize, dtype=dtype, path=path, block_size=4
+    )
+    if path is not None:
+        condensed = CondensedDistanceMatrix.open(path)
+    assert condensed.shape == dense.shape
+    np.testing.assert_allclose(np.asarray(condensed), dense, atol=1e-4)
+    for i in range(len(h3_sequences)):
+        np.testing.assert_allclose(condensed.row(i), dense[i], atol=1e-4)
+    eps = 0.3 if normalize else 2
+    np.testing.assert_array_equal(
+        condensed.radius_neighbors(0, eps), np.flatnonzero(dense[0] <= eps + 1e-4)
+    )
+
+
+def test_condensed_uint16_size(h3_sequences):
+    condensed = CondensedDistanceMatrix.from_h3_sequences(h3_sequences)
+    n = len(h3_sequences)
+    assert condensed.data.dtype == np.uint16
+    assert condensed.data.nbytes == 2 * n * (n - 1) // 2
+
+
+def test_condensed_max_distance(h3_sequences):
+    dense = edist_distance_matrix(h3_sequences)
+    condensed = CondensedDistanceMatrix.from_h3_sequences(
+        h3_sequences, max_distance=0.3
+    )
+    assert np.isinf(condensed.row(0)[dense[0] > 0.3]).all()
+    sparse = condensed.to_sparse(0.3)
+    np.testing.assert_allclose(
+        sparse.toarray(), np.where(dense <= 0.3, dense, 0), atol=1e-4
+    )
+
+
+def test_clustering_with_condensed(h3_sequences):
+    condensed = CondensedDistanceMatrix.from_h3_sequences(h3_sequences)
+    pd.testing.assert_series_equal(
+        dbscan_with_edist_metric(h3_sequences, eps=0.3, min_samples=3),
+        dbscan_with_edist_metric(
+            h3_sequences, eps=0.3, min_samples=3, distance_matrix=condensed
+        ),
+    )
+    cluster_ids = optics_with_edist_metric(
+        h3_sequences, min_samples=3, max_eps=0.5, distance_matrix=condensed
+    )
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[-1]
+
+
+@pytest.mark.parametrize("dtype", ["uint16", "float32"])
+def test_condensed_eps_equal_to_distance(dtype):
+    # 0.2 is stored slightly above 0.2 with both dtypes
+    h3_sequences = pd.Series([list(s) for s in ["ABCDE", "ABCDX", "ABCYE", "ZBCDE"]])
+    condensed = CondensedDistanceMatrix.from_h3_sequences(h3_sequences, dtype=dtype)
+    np.testing.assert_array_equal(condensed.radius_neighbors(0, 0.2), [0, 1, 2, 3])
+    assert condensed.to_sparse(0.2).max() == 0.2
+    cluster_ids = dbscan_with_edist_metric(
+        h3_sequences, eps=0.2, min_samples=4, distance_matrix=condensed
+    )
+    pd.testing.assert_series_equal(
+        cluster_ids, dbscan_with_edist_metric(h3_sequences, eps=0.2, min_samples=4)
+    )
+    assert (cluster_ids == 0).all()
+
+
+def test_kmedoids_rejects_thresholded_condensed(h3_sequences):
+    condensed = CondensedDistanceMatrix.from_h3_sequences(
+        h3_sequences, max_distance=0.3
+    )
+    assert condensed.has_missing()
+    with pytest.raises(TypeError, match="missing"):
+        kmedoids_with_edist_metric(
+            h3_sequences, n_clusters=2, distance_matrix=condensed
+        )
+
+
+def test_hdbscan_with_thresholded_condensed(h3_sequences):
+    # missing distances are completed like those of a sparse matrix
+    condensed = CondensedDistanceMatrix.from_h3_sequences(
+        h3_sequences, max_distance=0.3
+    )
+    assert not CondensedDistanceMatrix.from_h3_sequences(h3_sequences).has_missing()
+    cluster_ids = hdbscan_with_edist_metric(
+        h3_sequences, distance_matrix=condensed, min_cluster_size=3
+    )
+    expected = hdbscan_with_edist_metric(
+        h3_sequences,
+        distance_matrix=edist_distance_matrix(h3_sequences, max_distance=0.3),
+        min_cluster_size=3,
+    )
+    pd.testing.assert_series_equal(cluster_ids, expected)
+    assert (cluster_ids.iloc[:5] == 0).all()
+    assert (cluster_ids.iloc[6:] == 1).all()
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.h3_trafo import (
+    add_max_res_h3_column,
+    fill_in_h3_gaps,
+    h3_series_to_h3_parent,
+    h3_series_to_series_of_h3_sequences,
+    remove_subsequent_identical_elements,
+)
+from lagrangian_trajectory_clustering.h3_trafo_sharded import sharded_h3_sequences
+
+
+@pytest.fixture
+def trajectories():
+    rng = np.random.default_rng(0)
+    num_traj, num_obs = 12, 30
+    return pd.DataFrame(
+        {
+            "latitude": 50
+            + np.cumsum(rng.normal(size=(num_traj, num_obs)), axis=1).ravel(),
+            "longitude": -30
+            + np.cumsum(rng.normal(size=(num_traj, num_obs)), axis=1).ravel(),
+        },
+        index=pd.MultiIndex.from_product(
+            [np.arange(num_traj) * 3, np.arange(num_obs)], names=["traj", "obs"]
+        ),
+    )
+
+
+def _serial_chain(df, resolution, fill_gaps):
+    df = add_max_res_h3_column(df.copy(), max_res=10)
+    h3s = h3_series_to_h3_parent(df["h3maxres"], resolution=resolution)
+    sequences = remove_subsequent_identical_elements(
+        h3_series_to_series_of_h3_sequences(h3s)
+    )
+    if fill_gaps:
+        sequences = fill_in_h3_gaps(sequences)
+    return sequences
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+@pytest.mark.parametrize("fill_gaps", [True, False])
+def test_sharded_matches_serial(trajectories, num_workers, fill_gaps):
+    expected = _serial_chain(trajectories, 3, fill_gaps)
+    sequences = sharded_h3_sequences(
+        trajectories,
+        resolution=3,
+        max_res=10,
+        fill_gaps=fill_gaps,
+        num_workers=num_workers,
+        num_shards=5,
+    )
+    assert sequences.index.equals(expected.index)
+    assert sequences.tolist() == expected.tolist()
+
+
+def test_sharded_from_h3maxres(trajectories):
+    df = add_max_res_h3_column(trajectories.copy(), max_res=10)
+    expected = _serial_chain(trajectories, 3, True)
+    sequences = sharded_h3_sequences(df, resolution=3, num_workers=2)
+    assert sequences.tolist() == expected.tolist()
+    cells, offsets, traj = sharded_h3_sequences(
+        df, resolution=3, num_workers=1, return_codes=True
+    )
+    assert cells.dtype == np.uint64
+    assert traj.equals(expected.index)
+    assert [format(c, "x") for c in cells[offsets[1] : offsets[2]].tolist()] == (
+        expected.iloc[1]
+    )
@@ -9,6 +9,8 @@ from lagrangian_trajectory_clustering.metrics import (
     lcs_numpy_numba,
     lcs_pure,
     lcs_pure_numba,
+    levenshtein_bounded,
+    levenshtein_bounded_numba,
     levenshtein_numpy,
     levenshtein_numpy_numba,
 )
@@ -51,3 +53,32 @@ def test_lcs_implementations_back_to_back(
 def test_levenshtein(levenshtein_implementation):
     assert 3 == levenshtein_implementation("kitten", "sitting")
     assert 0 == levenshtein_implementation("abcde", "abcde")
+
+
+@pytest.mark.parametrize(
+    "levenshtein_implementation", [levenshtein_bounded, levenshtein_bounded_numba]
+)
+def test_levenshtein_bounded(levenshtein_implementation):
+    assert 3 == levenshtein_implementation("kitten", "sitting", 3)
+    assert 3 == levenshtein_implementation("kitten", "sitting", 10)
+    assert 3 == levenshtein_implementation("kitten", "sitting", 2)
+    assert 1 == levenshtein_implementation("kitten", "sitting", 0)
+    assert 0 == levenshtein_implementation("", "", 0)
+
+
+def test_levenshtein_bounded_back_to_back():
+    """Compare bounded Levenshtein with the full calculation."""
+    num_runs = 20
+    max_sequence_length = 30
+    for run in range(num_runs):
+        x = "".join(
+            random.choice("ABC") for n in range(random.randint(0, max_sequence_length))
+        )
+        y = "".join(
+            random.choice("ABC") for n in range(random.randint(0, max_sequence_length))
+        )
+        max_distance = random.randint(0, max_sequence_length)
+        full = levenshtein_numpy(x, y)
+        assert min(full, max_distance + 1) == levenshtein_bounded_numba(
+            x, y, max_distance
+        )
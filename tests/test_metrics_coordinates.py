@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import dbscan_with_coordinate_metric
+from lagrangian_trajectory_clustering.data_loading import (
+    trajectories_to_coordinate_sequences,
+)
+from lagrangian_trajectory_clustering.distance_matrix import coordinate_distance_matrix
+from lagrangian_trajectory_clustering.metrics_coordinates import (
+    discrete_frechet,
+    dtw,
+    edr,
+    frechet_lower_bound,
+    haversine,
+    lb_keogh,
+    lb_kim,
+    lcss,
+)
+from lagrangian_trajectory_clustering.metrics_wrapped import wrapped_metric
+
+
+def _random_trajectory(rng, length, lat0=50.0, lon0=-30.0):
+    steps = rng.normal(scale=0.2, size=(length, 2))
+    return np.array([lat0, lon0]) + np.cumsum(steps, axis=0)
+
+
+def test_haversine():
+    # one degree of latitude
+    assert haversine(0.0, 0.0, 1.0, 0.0) == pytest.approx(111.19, abs=0.01)
+    assert haversine(10.0, 179.5, 10.0, -179.5) == pytest.approx(
+        haversine(10.0, 0.0, 10.0, 1.0)
+    )
+
+
+def test_metrics_identical_trajectories():
+    x = _random_trajectory(np.random.default_rng(0), 20)
+    assert dtw(x, x) == 0
+    assert discrete_frechet(x, x) == 0
+    assert edr(x, x, 1.0) == 0
+    assert lcss(x, x, 1.0) == 0
+
+
+def test_dtw_window():
+    rng = np.random.default_rng(1)
+    x = _random_trajectory(rng, 20)
+    y = _random_trajectory(rng, 25)
+    assert dtw(x, y, 2) >= dtw(x, y, 10) >= dtw(x, y)
+    assert dtw(x, y, 30) == dtw(x, y)
+
+
+@pytest.mark.parametrize("window", [-1, 0, 3])
+def test_lower_bounds(window):
+    rng = np.random.default_rng(2)
+    for run in range(20):
+        x = _random_trajectory(rng, rng.integers(1, 30))
+        y = _random_trajectory(rng, rng.integers(1, 30), lat0=51.0)
+        distance = dtw(x, y, window)
+        assert lb_kim(x, y) <= distance + 1e-9
+        assert lb_keogh(x, y, window) <= distance + 1e-9
+        assert frechet_lower_bound(x, y) <= discrete_frechet(x, y) + 1e-9
+
+
+def test_early_abandoning():
+    rng = np.random.default_rng(3)
+    x = _random_trajectory(rng, 20)
+    y = _random_trajectory(rng, 20, lat0=55.0)
+    assert dtw(x, y, -1, 1.0) == np.inf
+    assert discrete_frechet(x, y, 1.0) == np.inf
+    assert dtw(x, y, -1, 1e9) == dtw(x, y)
+
+
+def test_wrapped_coordinate_metric():
+    rng = np.random.default_rng(4)
+    sequences = [_random_trajectory(rng, 10), _random_trajectory(rng, 12)]
+    dtw_wrapped = wrapped_metric(metric_function=dtw, sequences_mapping=sequences)
+    assert dtw_wrapped([0], [1]) == dtw(sequences[0], sequences[1])
+
+
+@pytest.mark.parametrize(
+    "metric, max_distance, eps",
+    [("dtw", 500.0, None), ("frechet", 80.0, None), ("edr", 8, 20.0)],
+)
+def test_coordinate_distance_matrix_sparse_matches_dense(metric, max_distance, eps):
+    rng = np.random.default_rng(5)
+    sequences = pd.Series(
+        [_random_trajectory(rng, rng.integers(5, 15), lat0=lat) for lat in [50, 51] * 5]
+    )
+    dense = coordinate_distance_matrix(sequences, metric=metric, eps=eps)
+    sparse = coordinate_distance_matrix(
+        sequences, metric=metric, max_distance=max_distance, eps=eps
+    )
+    np.testing.assert_allclose(
+        sparse.toarray(), np.where(dense <= max_distance, dense, 0)
+    )
+    assert sparse.nnz == (dense <= max_distance).sum()
+
+
+def test_dbscan_with_coordinate_metric():
+    rng = np.random.default_rng(6)
+    df = pd.concat(
+        [
+            pd.DataFrame(
+                _random_trajectory(rng, 10, lat0=lat, lon0=0.0) * [1, 0.1],
+                columns=["latitude", "longitude"],
+            ).assign(traj=traj, obs=np.arange(10))
+            for traj, lat in enumerate([10.0] * 4 + [20.0] * 4)
+        ]
+    ).set_index(["traj", "obs"])
+    sequences = trajectories_to_coordinate_sequences(df)
+    assert len(sequences) == 8
+    assert sequences.iloc[0].shape == (10, 2)
+    cluster_ids = dbscan_with_coordinate_metric(
+        sequences, eps=200.0, metric="frechet", min_samples=2
+    )
+    assert cluster_ids.iloc[:4].nunique() == 1
+    assert cluster_ids.iloc[4:].nunique() == 1
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[4]
@@ -0,0 +1,89 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import (
+    approximate_dbscan_with_edist_metric,
+    dbscan_with_edist_metric,
+)
+from lagrangian_trajectory_clustering.distance_matrix import edist_distance_matrix
+from lagrangian_trajectory_clustering.h3_trafo import h3_sequences_to_codes
+from lagrangian_trajectory_clustering.sketching import (
+    approximate_edist_distance_matrix,
+    lsh_candidate_pairs,
+    minhash_signatures,
+)
+
+
+@pytest.fixture
+def h3_sequences(make_h3_sequences):
+    return make_h3_sequences(different_lengths=True)
+
+
+def test_minhash_estimates_jaccard_similarity():
+    rng = np.random.default_rng(0)
+    a = rng.permutation(200)[:100]
+    b = np.r_[a[:50], np.arange(200, 250)]
+    codes = np.r_[a, b, a[::-1]]
+    signatures = minhash_signatures(codes, np.array([0, 100, 200, 300]), num_perm=512)
+    # permutations of the same cells have identical signatures
+    np.testing.assert_array_equal(signatures[0], signatures[2])
+    # Jaccard similarity of a and b is 50 / 150
+    assert abs(np.mean(signatures[0] == signatures[1]) - 1 / 3) < 0.07
+
+
+def test_shingle_size_distinguishes_order():
+    codes = np.r_[np.arange(10), np.arange(10)[::-1]]
+    offsets = np.array([0, 10, 20])
+    cells = minhash_signatures(codes, offsets, shingle_size=1)
+    bigrams = minhash_signatures(codes, offsets, shingle_size=2)
+    assert (cells[0] == cells[1]).all()
+    assert not (bigrams[0] == bigrams[1]).any()
+
+
+def test_lsh_candidate_pairs():
+    signatures = np.array([[1, 2, 3, 4], [1, 2, 5, 6], [7, 8, 3, 4], [9, 9, 9, 9]])
+    pair_i, pair_j = lsh_candidate_pairs(signatures.astype(np.uint64), num_bands=2)
+    assert list(zip(pair_i, pair_j)) == [(0, 1), (0, 2)]
+    pair_i, pair_j = lsh_candidate_pairs(signatures.astype(np.uint64), num_bands=1)
+    assert len(pair_i) == 0
+    with pytest.raises(ValueError):
+        lsh_candidate_pairs(signatures.astype(np.uint64), num_bands=3)
+
+
+def test_approximate_distances_are_exact_subset(h3_sequences):
+    exact = edist_distance_matrix(h3_sequences, max_distance=0.5).toarray()
+    approx = approximate_edist_distance_matrix(
+        h3_sequences, max_distance=0.5, num_bands=8
+    ).toarray()
+    found = approx > 0
+    np.testing.assert_allclose(approx[found], exact[found])
+    # with 32 bands of 2 rows, all neighbouring pairs are candidates
+    codes, offsets, _ = h3_sequences_to_codes(h3_sequences)
+    pair_i, pair_j = lsh_candidate_pairs(minhash_signatures(codes, offsets), 32)
+    assert set(zip(*np.nonzero(np.triu(exact > 0)))) <= set(zip(pair_i, pair_j))
+
+
+def test_approximate_dbscan_matches_exact(h3_sequences):
+    exact = dbscan_with_edist_metric(h3_sequences, eps=0.3, min_samples=2)
+    approx = approximate_dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=2, num_perm=64, num_bands=32
+    )
+    pd.testing.assert_series_equal(approx, exact)
+
+
+def test_approximate_max_bucket_size(h3_sequences):
+    # buckets of a single sequence give no candidate pairs
+    approx = approximate_edist_distance_matrix(
+        h3_sequences, max_distance=0.3, max_bucket_size=1
+    )
+    assert approx.nnz == len(h3_sequences)
+    cluster_ids = approximate_dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=2, max_bucket_size=1
+    )
+    assert (cluster_ids == -1).all()
+    limited = approximate_edist_distance_matrix(
+        h3_sequences, max_distance=0.3, max_bucket_size=3
+    )
+    full = approximate_edist_distance_matrix(h3_sequences, max_distance=0.3)
+    assert len(h3_sequences) < limited.nnz <= full.nnz
@@ -0,0 +1,96 @@
+import h3
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import dbscan_with_edist_metric
+from lagrangian_trajectory_clustering.distance_matrix import edist_distance_matrix
+from lagrangian_trajectory_clustering.h3_trafo import (
+    h3_cell_distance_table,
+    h3_sequences_to_codes,
+)
+from lagrangian_trajectory_clustering.metrics import (
+    levenshtein_numpy,
+    weighted_levenshtein,
+)
+
+
+def _h3_path(lat0, lon0, lat1, lon1, resolution=5):
+    return h3.h3_line(
+        h3.geo_to_h3(lat0, lon0, resolution), h3.geo_to_h3(lat1, lon1, resolution)
+    )
+
+
+@pytest.fixture
+def h3_sequences():
+    """Parallel paths: neighbouring ones and ones far apart."""
+    return pd.Series(
+        [_h3_path(50.0 + dlat, -30.0, 50.0 + dlat, -25.0) for dlat in [0, 0.05, 0.1]]
+        + [_h3_path(40.0 + dlat, -30.0, 40.0 + dlat, -25.0) for dlat in [0, 0.05]]
+    )
+
+
+def test_h3_cell_distance_table(h3_sequences):
+    _, _, cells = h3_sequences_to_codes(h3_sequences)
+    offsets, codes, distances = h3_cell_distance_table(cells, 3)
+    assert len(offsets) == len(cells) + 1
+    for i in range(len(cells)):
+        row = codes[offsets[i] : offsets[i + 1]]
+        assert (np.diff(row) > 0).all()
+        for code, distance in zip(row, distances[offsets[i] : offsets[i + 1]]):
+            assert 0 < distance < 3
+            assert distance == h3.h3_distance(cells[i], cells[code])
+
+
+def test_weighted_levenshtein(h3_sequences):
+    codes, offsets, cells = h3_sequences_to_codes(h3_sequences)
+    sequences = [codes[offsets[i] : offsets[i + 1]] for i in range(len(offsets) - 1)]
+    table_1 = h3_cell_distance_table(cells, 1)
+    table_4 = h3_cell_distance_table(cells, 4)
+    for x in sequences:
+        for y in sequences:
+            plain = levenshtein_numpy(x, y)
+            assert weighted_levenshtein(x, y, *table_1, 1) == plain
+            weighted = weighted_levenshtein(x, y, *table_4, 4)
+            assert weighted <= plain
+            if plain > 0:
+                assert weighted > 0
+            assert weighted_levenshtein(x, y, *table_4, 4, weighted) == weighted
+            if weighted > 0:
+                assert (
+                    weighted_levenshtein(x, y, *table_4, 4, weighted * 0.99) == np.inf
+                )
+
+
+@pytest.mark.parametrize("max_cell_distance", [0, 256, 300])
+def test_max_cell_distance_out_of_range(h3_sequences, max_cell_distance):
+    # cell distances are kept as uint8
+    codes, offsets, cells = h3_sequences_to_codes(h3_sequences)
+    with pytest.raises(ValueError, match="1..255"):
+        h3_cell_distance_table(cells, max_cell_distance)
+    with pytest.raises(ValueError, match="1..255"):
+        edist_distance_matrix(h3_sequences, max_cell_distance=max_cell_distance)
+    table = h3_cell_distance_table(cells, 2)
+    with pytest.raises(ValueError, match="1..255"):
+        weighted_levenshtein(codes[:3], codes[3:6], *table, max_cell_distance)
+
+
+def test_weighted_edist_distance_matrix(h3_sequences):
+    plain = edist_distance_matrix(h3_sequences)
+    dense = edist_distance_matrix(h3_sequences, max_cell_distance=4)
+    assert (dense <= plain + 1e-12).all()
+    # neighbouring paths get much closer
+    assert dense[0, 1] < 0.5 * plain[0, 1]
+    sparse = edist_distance_matrix(h3_sequences, max_distance=0.3, max_cell_distance=4)
+    np.testing.assert_allclose(sparse.toarray(), np.where(dense <= 0.3, dense, 0))
+
+
+def test_dbscan_with_weighted_edist_metric(h3_sequences):
+    cluster_ids = dbscan_with_edist_metric(
+        h3_sequences, eps=0.3, min_samples=2, max_cell_distance=4
+    )
+    assert cluster_ids.iloc[:3].nunique() == 1
+    assert cluster_ids.iloc[3:].nunique() == 1
+    assert cluster_ids.iloc[0] != cluster_ids.iloc[3]
+    with pytest.raises(ValueError):
+        dbscan_with_edist_metric(h3_sequences, max_cell_distance=4, return_model=True)
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from lagrangian_trajectory_clustering.clustering import (
+    windowed_dbscan_with_edist_metric,
+)
+from lagrangian_trajectory_clustering.distance_matrix import edist_distance_matrix
+from lagrangian_trajectory_clustering.windowing import SlidingWindowSequences
+
+
+@pytest.fixture
+def trajectories():
+    """Random walks with daily positions, one starting late and one ending early."""
+    rng = np.random.default_rng(0)
+    num_traj, num_obs = 40, 60
+    steps = rng.normal(scale=0.15, size=(2, num_traj, num_obs))
+    time = np.datetime64("1993-01-01", "ns") + np.arange(num_obs) * np.timedelta64(
+        1, "D"
+    )
+    df = pd.DataFrame(
+        {
+            "time": np.tile(time, num_traj),
+            "latitude": (15 + np.cumsum(steps[0], axis=1)).ravel(),
+            "longitude": (-25 + np.cumsum(steps[1], axis=1)).ravel(),
+        },
+        index=pd.MultiIndex.from_product(
+            [np.arange(num_traj), np.arange(num_obs)], names=["traj", "obs"]
+        ),
+    )
+    df = df.drop(index=df.query("traj == 3 and obs < 30").index)
+    return df.drop(index=df.query("traj == 4 and obs > 10").index)
+
+
+def test_from_trajectories():
+    a, b = "8001fffffffffff", "8003fffffffffff"
+    df = pd.DataFrame(
+        {
+            "time": pd.to_datetime(
+                ["1993-01-01", "1993-01-02", "1993-01-03", "1993-01-01", "1993-01-05"]
+            ),
+            "h3maxres": [a, a, b, b, b],
+        },
+        index=pd.MultiIndex.from_arrays(
+            [[7, 7, 7, 9, 9], [0, 1, 2, 0, 1]], names=["traj", "obs"]
+        ),
+    )
+    store = SlidingWindowSequences.from_trajectories(df, resolution=0)
+    np.testing.assert_array_equal(store.offsets, [0, 2, 3])
+    np.testing.assert_array_equal(store.codes, [0, 1, 1])
+    np.testing.assert_array_equal(
+        store.times, pd.to_datetime(["1993-01-01", "1993-01-03", "1993-01-01"])
+    )
+    np.testing.assert_array_equal(
+        store.last_times, pd.to_datetime(["1993-01-03", "1993-01-05"])
+    )
+    assert list(store.traj) == [7, 9]
+
+    # the cell occupied at the start of the window is included
+    starts, ends = store.window_bounds("1993-01-02", "1993-01-03")
+    np.testing.assert_array_equal(starts, [0, 2])
+    np.testing.assert_array_equal(ends, [1, 3])
+    starts, ends = store.window_bounds("1993-01-04", "1993-01-06")
+    np.testing.assert_array_equal(ends - starts, [0, 1])
+
+
+@pytest.mark.parametrize("normalize, max_distance", [(True, 0.5), (False, 3)])
+def test_window_distance_matrices_match_exact(trajectories, normalize, max_distance):
+    store = SlidingWindowSequences.from_trajectories(trajectories, resolution=2)
+    num_computed = 0
+    num_pairs = 0
+    for window_start, traj, distances, computed in store.iter_window_distance_matrices(
+        "20D", "1D", max_distance, normalize=normalize, min_length=2, block_size=16
+    ):
+        ((_, active, starts, ends),) = store.windows(
+            "20D", "1D", start=window_start, end=window_start, min_length=2
+        )
+        h3_sequences = store.to_h3_sequences(active, starts, ends)
+        assert list(h3_sequences.index) == list(traj)
+        assert all(len(seq) >= 2 for seq in h3_sequences)
+        exact = edist_distance_matrix(
+            h3_sequences, normalize=normalize, max_distance=max_distance
+        )
+        assert distances.nnz == exact.nnz
+        np.testing.assert_allclose(distances.toarray(), exact.toarray())
+        num_computed += computed
+        num_pairs += len(traj) * (len(traj) - 1) // 2
+    # most pairs are reused or skipped
+    assert num_computed < num_pairs / 2
+
+
+def test_windowed_dbscan_with_edist_metric(trajectories):
+    store = SlidingWindowSequences.from_trajectories(trajectories, resolution=2)
+    cluster_ids = windowed_dbscan_with_edist_metric(
+        store, "20D", "10D", eps=0.3, min_samples=2
+    )
+    assert cluster_ids.index.names == ["window_start", "traj"]
+    window_starts = cluster_ids.index.get_level_values("window_start").unique()
+    assert list(window_starts) == list(
+        pd.date_range("1993-01-01", "1993-03-01", freq="10D")
+    )
+    # trajectory 3 starts late and trajectory 4 ends early
+    assert 3 not in cluster_ids.loc["1993-01-01"].index
+    assert 4 not in cluster_ids.loc["1993-01-21"].index
+    assert 3 in cluster_ids.loc["1993-01-21"].index
+    assert (cluster_ids >= 0).any()
+
+
+def test_windowed_dbscan_without_active_trajectories(trajectories):
+    store = SlidingWindowSequences.from_trajectories(trajectories, resolution=2)
+    cluster_ids = windowed_dbscan_with_edist_metric(
+        store, "20D", "10D", eps=0.3, min_samples=2, min_length=1000
+    )
+    assert len(cluster_ids) == 0
+    assert cluster_ids.name == "cluster_ids"
+    assert cluster_ids.index.names == ["window_start", "traj"]